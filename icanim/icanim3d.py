@@ -6,22 +6,62 @@
 #######################
 
 from math import pi
+import os
 import vpython as vp
-from numpy import arange #vpython comes with numpy
-from mazegen import Maze
+from numpy import arange, array, argwhere, indices, stack, zeros_like, concatenate, load, save #vpython comes with numpy
+from mazegen import Maze, generate_many
 
-def mazeTo3D(maze=None,z=1,vis=False):
-    '''Turns maze into two lists of boxes (default invisible).'''
+def cellRects(cells):
+    '''Greedily covers the True cells of a 2D boolean array with few axis-aligned rectangles: each run along a row
+    is extended down as far as the run stays filled. Returns (top row, left col, bottom row, right col) tuples (inclusive).'''
+    todo = array(cells,dtype=bool)
+    rows,cols = todo.shape
+    rects = []
+    for r in range(rows):
+        c = 0
+        while c < cols:
+            if not todo[r,c]:
+                c += 1
+                continue
+            right = c
+            while right+1 < cols and todo[r,right+1]:
+                right += 1
+            bottom = r
+            while bottom+1 < rows and todo[bottom+1,c:right+1].all():
+                bottom += 1
+            todo[r:bottom+1,c:right+1] = False
+            rects.append((r,c,bottom,right))
+            c = right+1
+    return rects
+
+def mazeTo3D(maze=None,z=1,vis=False,merge=False,lookup=None,compound=False):
+    '''Turns maze into two lists of boxes (default invisible).
+    merge = True builds each list from the fewest boxes it can (see cellRects) instead of one box per cell.
+    If lookup is a dict, it gets filled with (row, col) -> the box covering that cell.
+    compound = True fuses each list into one vp.compound (None if empty) that moves, recolors and hides as one object.
+    The two can't be combined, since a compound absorbs the boxes lookup would point at.'''
+    if compound and lookup is not None:
+        raise ValueError('lookup only works without compound')
     if maze is None:
         maze = Maze()
-    etch = []
-    complement = []
-    for r,row in enumerate(maze.maze):
-        for c,cell in enumerate(row):
-            if cell == 1:
-                etch.append(vp.box(pos=vp.vector(c,5,r),length=1,height=z,width=1,visible=vis))
-            else:
-                complement.append(vp.box(pos=vp.vector(c,5,r),length=1,height=z,width=1,visible=vis))
+    lists = []
+    for cells in (maze.grid == 1, maze.grid != 1): # etch, complement
+        if merge:
+            rects = cellRects(cells)
+        else:
+            rects = [(r,c,r,c) for r,c in argwhere(cells)]
+        boxes = []
+        for top,left,bottom,right in rects:
+            box = vp.box(pos=vp.vector((left+right)/2,5,(top+bottom)/2),length=right-left+1,height=z,width=bottom-top+1,visible=vis)
+            boxes.append(box)
+            if lookup is not None:
+                for r in range(top,bottom+1):
+                    for c in range(left,right+1):
+                        lookup[r,c] = box
+        if compound:
+            boxes = vp.compound(boxes,visible=vis) if boxes else None
+        lists.append(boxes)
+    etch,complement = lists
     return etch,complement
 
 def changeHeight(boxes, newHeight, mode=1):
@@ -61,7 +101,9 @@ def changeHeight(boxes, newHeight, mode=1):
                 box.visible = False
 
 def mazeVisible(boxes):
-    '''Switches visibility of a 3D maze.'''
+    '''Switches visibility of a 3D maze (a list of boxes or a single object such as a compound).'''
+    if not isinstance(boxes,list):
+        boxes = [boxes]
     for box in boxes:
         box.visible = False if box.visible else True
 
@@ -94,43 +136,56 @@ def newLabel(string,col=0):
     else:
         raise ValueError('col must be 0 or 1.')
 
-def pixelatedCylinder(height, radius, perRadius, color):
-    '''Creates a "cylinder" made up of a list of invisible boxes at the origin and perRadius boxes fitting in a radius.'''
-    quarter = [[0]*perRadius for i in arange(perRadius)]
-    for i in arange(perRadius):
-        for j in arange(perRadius):
-            if j**2>perRadius**2-i**2:
-                continue
-            quarter[i][j] = 1
-    boxes = []
+CACHE = '.icanimcache' # precomputed layouts, relative to the working directory (icanim)
+layouts = {} # (height, radius, perRadius) -> layout already computed or loaded in this process
+
+def cylinderLayout(height, radius, perRadius):
+    '''Computes the box centers of pixelatedCylinder as an (n,3) array, all 4 quadrants at once (each quadrant is
+    the previous one turned a quarter turn about the y axis). Cached on disk, keyed by (height, radius, perRadius).'''
+    key = height,radius,perRadius
+    if key in layouts:
+        return layouts[key]
+    path = os.path.join(CACHE,'cylinder_%r_%r_%r.npy' % key)
+    try:
+        layouts[key] = load(path)
+        return layouts[key]
+    except (OSError,ValueError): # not cached yet (or unreadable)
+        pass
+    i,j = indices((perRadius,perRadius))
+    inside = j**2 <= perRadius**2-i**2 # quarter disk
     side = radius/perRadius
-    for x,row in enumerate(quarter):
-        for z,val in enumerate(row):
-            if val == 1:
-                # weird float stuff
-                boxes.append(vp.box(pos=vp.vector(x/radius+side*x/1.4,0,z/radius+side*z/1.4),length=side,height=height,width=side,color=color,visible=False))
-    second = []
-    for box in boxes:
-        second.append(box.clone(visible=False))
-    for box in second:
-        box.rotate(angle=pi/2,axis=vp.vector(0,1,0),origin=vp.vector(0,0,0))
-    third = []
-    for box in second:
-        third.append(box.clone(visible=False))
-    for box in third:
-        box.rotate(angle=pi/2,axis=vp.vector(0,1,0),origin=vp.vector(0,0,0))
-    fourth = []
-    for box in third:
-        fourth.append(box.clone(visible=False))
-    for box in fourth:
-        box.rotate(angle=pi/2,axis=vp.vector(0,1,0),origin=vp.vector(0,0,0))
-    boxes.extend(second)
-    boxes.extend(third)
-    boxes.extend(fourth)
-    return boxes
+    x = i[inside]/radius+side*i[inside]/1.4 # weird float stuff
+    z = j[inside]/radius+side*j[inside]/1.4
+    quadrants = []
+    for turn in range(4):
+        quadrants.append(stack((x,zeros_like(x),z),axis=1))
+        x,z = z,-x # quarter turn about the y axis
+    positions = layouts[key] = concatenate(quadrants)
+    os.makedirs(CACHE,exist_ok=True)
+    save(path,positions)
+    return positions
+
+def pixelatedCylinder(height, radius, perRadius, color, layout=None):
+    '''Creates a "cylinder" made up of a list of invisible boxes at the origin and perRadius boxes fitting in a radius.
+    layout is the cylinderLayout of the same arguments if it was already computed (as by prepare).'''
+    side = radius/perRadius
+    if layout is None:
+        layout = cylinderLayout(height,radius,perRadius)
+    return [vp.box(pos=vp.vector(x,y,z),length=side,height=height,width=side,color=color,visible=False)
+            for x,y,z in layout.tolist()]
+
+def prepare():
+    '''Does the heavy setup that needs no VPython objects (maze grids and chip layout), so it can run in the background
+    while another part plays. Returns a dict for main.'''
+    return {'maze': Maze().grid, # the mask/photoresist maze
+            'layers': generate_many(['1','2','3','4','5'],workers=1), # BEOL layers; too small to be worth a process pool
+            'chips': cylinderLayout(0.3,7,10)}
 
-def main():
-    '''Driver program for 3D animation about IC manufacturing.'''
+def main(prepared=None):
+    '''Driver program for 3D animation about IC manufacturing. prepared is what prepare returned (computed here if None).'''
+    if prepared is None:
+        prepared = prepare()
+    maze = Maze.fromGrid(prepared['maze'])
     print('Setting up...please wait...')
     cv = vp.canvas(title='IC Manufacturing',width=1000,height=1000,background=vp.color.white,autoscale=True,userzoom=False,userspin=False,userpan=False)
     cv.autoscale = False
@@ -141,7 +196,7 @@ def main():
     # vp.arrow(pos=vp.vector(0,0,0),axis=vp.vector(0,5,0),color=vp.vector(0,1,0),length=15)
     # vp.arrow(pos=vp.vector(0,0,0),axis=vp.vector(0,0,5),color=vp.vector(0,0,1),length=15)
     wafer = vp.cylinder(axis=vp.vector(0,0.1,0),radius=7,color=vp.vector(0.3,0.9,1))
-    chips = pixelatedCylinder(0.3,7,10,wafer.color) # this takes a while (preload)
+    chips = pixelatedCylinder(0.3,7,10,wafer.color,prepared['chips'])
     wafer.color = vp.color.white
     input('Hit enter to start.')
     disclaimer = vp.label(text='Note: Not to scale. Real materials/steps may vary.',pixel_pos=True, pos=vp.vector(10,980,0),height=25,box=False,align='left',color=vp.color.black)
@@ -219,7 +274,7 @@ def main():
     cv.camera.pos = vp.vector(10,8.5,6.5) # new camera pos
     cv.camera.rotate(angle=-0.3,axis=vp.vector(-1,0,1))
     cv.camera.rotate(angle=0.5,axis=vp.vector(0,1,0),origin=vp.vector(0,10,0))
-    mask,maskLight = mazeTo3D(z=0.1)
+    mask,maskLight = mazeTo3D(maze,z=0.1,merge=True)
     for box in mask:
         box.rotate(angle=pi/2,axis=vp.vector(1,0,0),origin=vp.vector(4,0,0))
         box.pos.y += 8
@@ -317,8 +372,8 @@ def main():
     cv.camera.pos = vp.vector(5,8,5)
     cv.background = vp.color.white
     wafer.visible = label.visible = optics.visible = photoresist.visible = False
-    etch,complement = mazeTo3D(vis=True)
-    unexposed,exposed = mazeTo3D()
+    etch,complement = mazeTo3D(maze,vis=True,merge=True)
+    unexposed,exposed = mazeTo3D(maze,merge=True)
     for box in unexposed:
         box.pos.y = 6
         box.color = vp.color.purple
@@ -419,67 +474,48 @@ def main():
     vp.sleep(2)
     label.visible = False
     label = newLabel('(BEOL) Repeat the entire process 12-30x with different layers\nof different materials/functions (each with own masks), with vias in between.\nOverlay alignment is checked for every layer.')
-    maze11,maze12 = mazeTo3D(Maze(key='1'),z=0.1,vis=True)
-    maze21,maze22 = mazeTo3D(Maze(key='2'),z=0.1,vis=True)
-    maze31,maze32 = mazeTo3D(Maze(key='3'),z=0.1,vis=True)
-    maze41,maze42 = mazeTo3D(Maze(key='4'),z=0.1,vis=True)
-    maze51,maze52 = mazeTo3D(Maze(key='5'),z=0.1,vis=True)
+    layers = [Maze.fromGrid(grid) for grid in prepared['layers']]
+    maze11,maze12 = mazeTo3D(layers[0],z=0.1,vis=True,merge=True,compound=True)
+    maze21,maze22 = mazeTo3D(layers[1],z=0.1,vis=True,merge=True,compound=True)
+    maze31,maze32 = mazeTo3D(layers[2],z=0.1,vis=True,merge=True,compound=True)
+    maze41,maze42 = mazeTo3D(layers[3],z=0.1,vis=True,merge=True,compound=True)
+    maze51,maze52 = mazeTo3D(layers[4],z=0.1,vis=True,merge=True,compound=True)
     vias = []
     for i in arange(1,8,2):
         for j in arange(1,8,2):
             vias.append(vp.cylinder(pos=vp.vector(i-0.5,5.5,j-0.5),radius=0.2,axis=vp.vector(0,0,0),color=vp.vector(0.5,0.1,0)))
-    for box in maze11:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.3,0.9,1)
-    for box in maze12:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.5,0.1,0)
-    for box in maze21:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.3,0.9,1)
-    for box in maze22:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.5,0.1,0)
-    for box in maze31:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.3,0.9,1)
-    for box in maze32:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.5,0.1,0)
-    for box in maze41:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.3,0.9,1)
-    for box in maze42:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.5,0.1,0)
-    for box in maze51:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.3,0.9,1)
-    for box in maze52:
-        box.pos.y = 5.5
-        box.color = vp.vector(0.5,0.1,0)
+    maze11.pos.y = 5.5
+    maze11.color = vp.vector(0.3,0.9,1)
+    maze12.pos.y = 5.5
+    maze12.color = vp.vector(0.5,0.1,0)
+    maze21.pos.y = 5.5
+    maze21.color = vp.vector(0.3,0.9,1)
+    maze22.pos.y = 5.5
+    maze22.color = vp.vector(0.5,0.1,0)
+    maze31.pos.y = 5.5
+    maze31.color = vp.vector(0.3,0.9,1)
+    maze32.pos.y = 5.5
+    maze32.color = vp.vector(0.5,0.1,0)
+    maze41.pos.y = 5.5
+    maze41.color = vp.vector(0.3,0.9,1)
+    maze42.pos.y = 5.5
+    maze42.color = vp.vector(0.5,0.1,0)
+    maze51.pos.y = 5.5
+    maze51.color = vp.vector(0.3,0.9,1)
+    maze52.pos.y = 5.5
+    maze52.color = vp.vector(0.5,0.1,0)
     for i in arange(50):
         wait()
-        for box in maze11:
-            box.pos.y += 0.03
-        for box in maze12:
-            box.pos.y += 0.03
-        for box in maze21:
-            box.pos.y += 0.06
-        for box in maze22:
-            box.pos.y += 0.06
-        for box in maze31:
-            box.pos.y += 0.09
-        for box in maze32:
-            box.pos.y += 0.09
-        for box in maze41:
-            box.pos.y += 0.12
-        for box in maze42:
-            box.pos.y += 0.12
-        for box in maze51:
-            box.pos.y += 0.15
-        for box in maze52:
-            box.pos.y += 0.15
+        maze11.pos.y += 0.03
+        maze12.pos.y += 0.03
+        maze21.pos.y += 0.06
+        maze22.pos.y += 0.06
+        maze31.pos.y += 0.09
+        maze32.pos.y += 0.09
+        maze41.pos.y += 0.12
+        maze42.pos.y += 0.12
+        maze51.pos.y += 0.15
+        maze52.pos.y += 0.15
         for cyl in vias:
             cyl.axis = vp.vector(0,0.152*i,0)
     mazeVisible(align)
@@ -492,26 +528,16 @@ def main():
     vp.sleep(2)
     for i in arange(50):
         wait()
-        for box in maze11:
-            box.pos.y -= 0.03
-        for box in maze12:
-            box.pos.y -= 0.03
-        for box in maze21:
-            box.pos.y -= 0.058
-        for box in maze22:
-            box.pos.y -= 0.058
-        for box in maze31:
-            box.pos.y -= 0.086
-        for box in maze32:
-            box.pos.y -= 0.086
-        for box in maze41:
-            box.pos.y -= 0.114
-        for box in maze42:
-            box.pos.y -= 0.114
-        for box in maze51:
-            box.pos.y -= 0.142
-        for box in maze52:
-            box.pos.y -= 0.142
+        maze11.pos.y -= 0.03
+        maze12.pos.y -= 0.03
+        maze21.pos.y -= 0.058
+        maze22.pos.y -= 0.058
+        maze31.pos.y -= 0.086
+        maze32.pos.y -= 0.086
+        maze41.pos.y -= 0.114
+        maze42.pos.y -= 0.114
+        maze51.pos.y -= 0.142
+        maze52.pos.y -= 0.142
         for cyl in vias:
             cyl.axis = vp.vector(0,7.6-0.152*i,0)
     for cyl in vias:
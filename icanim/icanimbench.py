@@ -0,0 +1,128 @@
+#######################
+# icanimbench.py
+# Emerson Yu
+# Final Project
+# Headless benchmarks for the rendering and generation hot paths of the IC animation.
+# python icanimbench.py [--save results.json] [--baseline baseline.json] (run from the icanim directory)
+#######################
+
+import argparse, json, sys, time
+from statistics import median
+from icanimintro import pg, Animation, init, assets
+from icanimend import disintegrate
+from mazegen import Maze
+import icanim3d
+
+def timeIt(function, repeats=5):
+    '''Runs function repeats times and returns the median time in milliseconds.'''
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(1000*(time.perf_counter()-start))
+    return median(times)
+
+def newAnimation():
+    '''A headless Animation at the show's size and frame rate.'''
+    return Animation(1000,1000,40,'background.jpg',headless=True)
+
+def benchRefresh(results, counts=(1,10,50,100,250,500)):
+    '''Full refresh with count small sprites, and with count full-screen RGBA overlays (eb0-eb5 repeated),
+    both with every item changing and with all of them in the static layer (/static).
+    Items of the same image share one Surface, which refresh doesn't mind.'''
+    for kind in ('sprites','overlays'):
+        for count in counts:
+            a = newAnimation()
+            for i in range(count): # straight into the dictionary, since add refreshes after every item
+                if kind == 'sprites':
+                    img = assets.load('fermi7.png')
+                    a.dirty_rects['item'+str(i)] = img,img.get_rect(topleft=((i*37)%960,(i*53)%960))
+                else:
+                    img,offset = assets.trimmed('eb'+str(i%6)+'.png') # as add loads them
+                    a.dirty_rects['item'+str(i)] = img,img.get_rect(topleft=offset)
+            results['refresh/%s/%d/static' % (kind,count)] = timeIt(lambda: a.refresh(full=True))
+            def moving(): # every item changed this frame, so none of them are in the static layer
+                a.changed = dict.fromkeys(a.dirty_rects,a.frame)
+                a.refresh(full=True)
+            results['refresh/%s/%d' % (kind,count)] = timeIt(moving)
+
+def benchTweens(results):
+    '''Average cost of one frame of fade and move, over a caption and a few diagrams (one a full-screen overlay).'''
+    a = newAnimation()
+    for name in ('cmos1.png','transistor1.png','eb0.png'):
+        a.add(name)
+    a.add_text('cap1','One method of enhancing resolution is optical proximity correction (OPC).',x=20)
+    a.add('fermi7.png',x=100,y=600)
+    results['frame/fade'] = timeIt(lambda: a.fade('cap1'))/a.fps
+    results['frame/move'] = timeIt(lambda: a.move('fermi7',x=900-a.x_of('fermi7')))/a.fps
+
+def benchDisintegrate(results):
+    '''The three disintegrate calls on eb0 from the PBOPC step.'''
+    img = assets.load('eb0.png').copy()
+    def run():
+        disintegrate(img,40,300,190,840)
+        disintegrate(img,320,300,500,840)
+        disintegrate(img,160,480,350,680)
+    results['disintegrate'] = timeIt(run)
+
+def benchMazes(results, largest=512, vpython=False):
+    '''Maze generation for square sizes from 8 up to largest, and the number of boxes mazeTo3D makes per cell
+    or merged (with the merge time). vpython = True also times building the actual boxes (opens a browser scene).'''
+    size = 8
+    while size <= largest:
+        results['maze/generate/%d' % size] = timeIt(lambda: Maze(size,size,key=size),repeats=1 if size > 128 else 5)
+        grid = Maze(size,size,key=size).grid
+        results['maze/boxes/%d' % size] = grid.size
+        results['maze/merged_boxes/%d' % size] = len(icanim3d.cellRects(grid == 1))+len(icanim3d.cellRects(grid != 1))
+        results['maze/merge/%d' % size] = timeIt(lambda: (icanim3d.cellRects(grid == 1),icanim3d.cellRects(grid != 1)),repeats=1 if size > 128 else 5)
+        if vpython and size <= 64:
+            maze = Maze.fromGrid(grid)
+            results['maze/mazeTo3D/%d' % size] = timeIt(lambda: icanim3d.mazeTo3D(maze),repeats=1)
+            results['maze/mazeTo3D_merged/%d' % size] = timeIt(lambda: icanim3d.mazeTo3D(maze,merge=True),repeats=1)
+        size *= 2
+
+def compare(results, baseline, tolerance=0.2):
+    '''Returns (name, old, new) for every timing that got more than tolerance (a fraction) slower than baseline.
+    Box counts are compared exactly, since they don't depend on the machine.'''
+    regressions = []
+    for name,new in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        counted = '/boxes/' in name or '/merged_boxes/' in name
+        if (counted and new > old) or (not counted and new > old*(1+tolerance)):
+            regressions.append((name,old,new))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless benchmarks for the IC animation (run from the icanim directory).')
+    parser.add_argument('--save',help='write the results to this JSON file')
+    parser.add_argument('--baseline',help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance',type=float,default=0.2,help='allowed slowdown against the baseline (default 0.2 = 20%%)')
+    parser.add_argument('--largest',type=int,default=512,help='largest maze size to generate (default 512)')
+    parser.add_argument('--vpython',action='store_true',help='also time mazeTo3D building real VPython boxes')
+    args = parser.parse_args(argv)
+    init(headless=True)
+    results = {}
+    benchRefresh(results)
+    benchTweens(results)
+    benchDisintegrate(results)
+    benchMazes(results,args.largest,args.vpython)
+    pg.quit()
+    for name,value in results.items():
+        print('%-28s %12.3f' % (name,value) if isinstance(value,float) else '%-28s %12d' % (name,value))
+    if args.save:
+        with open(args.save,'w') as file:
+            json.dump(results,file,indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results,json.load(file),args.tolerance)
+        for name,old,new in regressions:
+            print('REGRESSION %s: %.3f -> %.3f' % (name,old,new))
+        if regressions:
+            return 1
+        print('No regressions against', args.baseline)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,12 +2,58 @@
 # icanimdriver.py
 # Emerson Yu
 # Final Project
-# Plays all parts of the animation in order.
+# Plays all parts of the animation in order, setting up the 3D part in the background while the intro plays.
+# python icanimdriver.py [--paced] plays it; python icanimdriver.py --export DIR [--workers N] renders the 2D parts headlessly
+# in parallel instead, section by section.
 #######################
 
-import icanimintro, icanim3d, icanimend, sys
+import icanimintro, icanim3d, icanimend, argparse, os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+SCRIPTS = {'intro': icanimintro, 'end': icanimend} # 2D scripts in playing order, each with named sections
+
+def renderSection(script, name, seek, until, out):
+    '''Renders one section of a script headlessly into its own subdirectory of out (runs in a worker process):
+    seeks to seek (None for the start of the script) and stops where section until starts (None for the end).'''
+    folder = os.path.join(out, '%s-%s' % (script, name))
+    try:
+        SCRIPTS[script].main(headless=True, record=folder, seek=seek, until=until)
+    except SystemExit: # how until stops the script
+        pass
+    return folder
+
+def export(out, workers=None):
+    '''Renders every section of every 2D script as its own job in a process pool, then stitches their frames in order into out.
+    Returns the total number of frames. The 3D section is not included, since VPython only draws in a browser.'''
+    jobs = [] # (script, section, seek, until)
+    for script, module in SCRIPTS.items():
+        names = module.sections()
+        for i, name in enumerate(names): # the first section also gets anything played before it
+            jobs.append((script, name, name if i > 0 else None, names[i+1] if i+1 < len(names) else None))
+    with ProcessPoolExecutor(workers) as pool:
+        folders = list(pool.map(renderSection, *zip(*jobs), [out]*len(jobs)))
+    n = 0
+    for folder in folders:
+        for frame in sorted(os.listdir(folder)):
+            n += 1
+            os.replace(os.path.join(folder, frame), os.path.join(out, '%06d.png' % n))
+        os.rmdir(folder)
+    return n
 
 if __name__ == '__main__':
-    icanimintro.main()
-    icanim3d.main()
-    icanimend.main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Plays the whole IC animation (run from the icanim directory).')
+    parser.add_argument('--paced', action='store_true', help='keep the 2D parts to the clock, skipping frames when drawing falls behind')
+    parser.add_argument('--export', metavar='DIR', help='render the 2D parts headlessly into DIR instead of playing')
+    parser.add_argument('--workers', type=int, help='worker processes for --export (default one per CPU)')
+    args = parser.parse_args()
+    if args.workers is not None and args.export is None:
+        parser.error('--workers only applies to --export')
+    if args.export is not None:
+        frames = export(args.export, args.workers)
+        print('Exported', frames, 'frames to', args.export)
+    else:
+        with ThreadPoolExecutor(1) as background:
+            prepared = background.submit(icanim3d.prepare)
+            icanimintro.main(paced=args.paced)
+            icanim3d.main(prepared.result())
+        icanimend.main(paced=args.paced)
\ No newline at end of file
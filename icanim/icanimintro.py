@@ -3,102 +3,592 @@
 # Emerson Yu
 # Final Project
 # This is the first 2D portion of the IC animation, with introductory information regarding semiconductors and transistors.
+# Its script (main) stays plain Python rather than a timeline (see icanimtimeline.py): it loops over generated moves, lays and
+# erases trails, erases and fades groups, and replaces items with transformed images, none of which timeline cues can express.
+# Its sections and their images are declared in SECTIONS instead.
+# python icanimintro.py [--record DIR | --stream FILE] [--seek TARGET] [--until SECTION] [--paced] [--trace FILE] (see --help)
 #######################
 
+import os, sys, re, threading, time, csv, json, subprocess, queue, argparse
+from math import hypot
+from collections import OrderedDict
+from functools import wraps
 import pygame as pg
-from numpy import arange
+from numpy import arange, percentile
+
+def init(headless=False):
+    '''Initializes pygame. headless = True uses SDL's dummy video driver, so no window is opened.'''
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    pg.init() # ignore pylint, this works fine
+
+class AssetCache:
+    '''Surfaces loaded from image files, shared by path. Once their total size goes over budget (bytes),
+    the least recently used ones are dropped. preload decodes files in a background thread.'''
+    def __init__(self,budget=256*2**20):
+        self.budget = budget
+        self.size = 0
+        self.surfaces = OrderedDict() # path -> [Surface, whether it has been converted yet]
+        self.bounds = {} # path -> Rect of the image's visible (not fully transparent) pixels
+        self.lock = threading.Lock()
+
+    def load(self,path) -> pg.Surface:
+        '''Returns the shared Surface for path, loading and converting it if needed.
+        Copy it before changing it (Animation.add does this).'''
+        with self.lock:
+            entry = self.surfaces.get(path)
+            if entry is not None:
+                self.surfaces.move_to_end(path)
+        if entry is None:
+            entry = [pg.image.load(path),False]
+        if not entry[1]: # converting needs the display, so it only happens here on the main thread
+            entry = [entry[0].convert_alpha(),True]
+            self.store(path,entry)
+        return entry[0]
+
+    def trimmed(self,path):
+        '''Returns the shared Surface for path cropped to its visible pixels (a subsurface, so copy it before changing it)
+        and the (x, y) of the crop within the full image. Images with nothing visible are not cropped.'''
+        img = self.load(path)
+        bounds = self.bounds.get(path)
+        if bounds is None:
+            bounds = self.bounds[path] = img.get_bounding_rect()
+        if bounds.width == 0 or bounds.height == 0 or bounds.size == img.get_size():
+            return img,(0,0)
+        return img.subsurface(bounds),bounds.topleft
+
+    def store(self,path,entry):
+        '''Puts an entry in the cache, then evicts the least recently used entries while over budget.'''
+        with self.lock:
+            if path in self.surfaces:
+                self.size -= self.bytes_of(self.surfaces.pop(path)[0])
+            self.surfaces[path] = entry
+            self.size += self.bytes_of(entry[0])
+            while self.size > self.budget and len(self.surfaces) > 1:
+                self.size -= self.bytes_of(self.surfaces.popitem(last=False)[1][0])
+
+    def preload(self,paths) -> threading.Thread:
+        '''Decodes the given files in a background thread and returns the (started) thread.'''
+        def run():
+            for path in paths:
+                with self.lock:
+                    if path in self.surfaces:
+                        continue
+                try:
+                    self.store(path,[pg.image.load(path),False])
+                except (pg.error,FileNotFoundError): # it will fail again (loudly) when actually used
+                    pass
+        thread = threading.Thread(target=run,daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def bytes_of(img) -> int:
+        return img.get_bytesize()*img.get_width()*img.get_height()
+
+assets = AssetCache() # shared by every Animation
+
+fonts = {} # (name, size) -> Font, so each font is only looked up once (until Animation.quit, since fonts die with pygame)
+
+def font_of(name='cambria',size=24) -> pg.font.Font:
+    '''Returns the shared Font for name and size, creating it on first use.'''
+    key = name,size
+    if key not in fonts:
+        fonts[key] = pg.font.SysFont(name,size)
+    return fonts[key]
+
+class TextCache:
+    '''Rendered text Surfaces keyed by (font, string, color, antialias). Fonts from font_of are shared,
+    so a font stands for its name and size. Holds at most limit entries, dropping the least recently used ones.'''
+    def __init__(self,limit=512):
+        self.limit = limit
+        self.surfaces = OrderedDict()
+
+    def render(self,font,string,color=(0,0,0),antialias=True) -> pg.Surface:
+        '''Returns a copy of the rendered text, rendering it only if it isn't cached.'''
+        key = font,string,tuple(color),antialias
+        img = self.surfaces.get(key)
+        if img is None:
+            img = self.surfaces[key] = font.render(string,antialias,color)
+            if len(self.surfaces) > self.limit:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return img.copy() # items change their own alpha
+
+    def clear(self):
+        self.surfaces.clear()
+
+texts = TextCache() # shared by every Animation
+
+class FrameTrace:
+    '''Per-frame timings recorded by an Animation: time spent composing and presenting, the whole frame's work time,
+    how many items and pixels (background included) were blitted, how many item draws were skipped because the item
+    was fully transparent (hidden), off-screen or outside the redrawn areas, whether the frame took longer than 1/fps,
+    and which call (and alias) was running. save writes them to path as CSV (.csv) or JSON (anything else).'''
+    FIELDS = ('frame','call','alias','compose_ms','present_ms','frame_ms','items','pixels','hidden','offscreen','outside','missed')
+
+    def __init__(self,path):
+        self.path = path
+        self.frames = [] # one dict per frame, with FIELDS as keys
+
+    def add(self,**record):
+        self.frames.append(record)
+
+    def save(self):
+        with open(self.path,'w',newline='') as file:
+            if self.path.endswith('.csv'):
+                writer = csv.DictWriter(file,self.FIELDS)
+                writer.writeheader()
+                writer.writerows(self.frames)
+            else:
+                json.dump(self.frames,file,indent=1)
+
+    def summary(self) -> str:
+        '''Frame time percentiles and the number of missed deadlines.'''
+        if not self.frames:
+            return 'No frames traced.'
+        times = [record['frame_ms'] for record in self.frames]
+        p50,p95,p99 = percentile(times,[50,95,99])
+        missed = sum(record['missed'] for record in self.frames)
+        culled = [sum(record[field] for record in self.frames) for field in ('hidden','offscreen','outside')]
+        return ('%d frames: p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, %d missed their deadline; ' % (len(times),p50,p95,p99,missed)
+                +'skipped %d hidden, %d off-screen and %d untouched item draws' % tuple(culled))
+
+class FrameSink:
+    '''Streams finished frames into the stdin of an encoder process, by default ffmpeg writing the video file output.
+    write copies the frame's pixels straight out of the Surface (through its buffer, with no bytes object in between)
+    into one of depth preallocated buffers, and a writer thread pipes them on, so encoding overlaps with composing
+    the next frames. When all the buffers are waiting to be written, write blocks until one is free again.
+    Frames are written as tightly packed rows, so any padding at the end of the Surface's rows is left out.'''
+    def __init__(self,surface,fps,output,depth=4,command=None):
+        self.row = surface.get_width()*surface.get_bytesize() # bytes of pixels per row
+        self.pitch = surface.get_pitch() # bytes from one row to the next in the Surface
+        self.height = surface.get_height()
+        if command is None:
+            command = ['ffmpeg','-loglevel','error','-y','-f','rawvideo','-pix_fmt',self.pix_fmt_of(surface),
+                       '-s','%dx%d' % surface.get_size(),'-r',str(fps),'-i','-','-pix_fmt','yuv420p',output]
+        self.process = subprocess.Popen(command,stdin=subprocess.PIPE) # buffered, so each write writes the whole frame
+        self.free = queue.Queue() # buffers ready to be filled
+        for i in range(depth):
+            self.free.put(bytearray(self.row*self.height))
+        self.full = queue.Queue() # filled buffers in frame order, then None to stop
+        self.frames = 0
+        self.error = None # the OSError that stopped the writer, if any
+        self.thread = threading.Thread(target=self.run,daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def pix_fmt_of(surface) -> str:
+        '''The ffmpeg pixel format matching the byte order of a 24 or 32 bit Surface.'''
+        if surface.get_bytesize() not in (3,4):
+            raise ValueError('Only 24 and 32 bit Surfaces can be streamed')
+        masks = surface.get_masks()[:3]
+        shifts = range(surface.get_bytesize()) if sys.byteorder == 'little' else reversed(range(surface.get_bytesize()))
+        order = ''.join('rgb'[masks.index(0xff << 8*i)] if 0xff << 8*i in masks else '0' for i in shifts)
+        return order+'24' if len(order) == 3 else order
+
+    def write(self,surface):
+        '''Queues the Surface's current pixels as the next frame.'''
+        if self.error is not None:
+            raise self.error
+        buffer = self.free.get()
+        pixels = surface.get_buffer()
+        view = memoryview(pixels)
+        if self.pitch == self.row:
+            buffer[:] = view
+        else: # one row at a time, skipping the padding
+            for y in range(self.height):
+                buffer[y*self.row:(y+1)*self.row] = view[y*self.pitch:y*self.pitch+self.row]
+        view.release()
+        del pixels # unlocks the Surface
+        self.full.put(buffer)
+        self.frames += 1
+
+    def run(self):
+        while True:
+            buffer = self.full.get()
+            if buffer is None:
+                return
+            if self.error is None:
+                try:
+                    self.process.stdin.write(buffer)
+                except OSError as error: # the encoder went away; write raises it on the main thread
+                    self.error = error
+            self.free.put(buffer)
+
+    def close(self) -> int:
+        '''Writes out the queued frames, then waits for the encoder to finish. Returns its exit code.'''
+        self.full.put(None)
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        return self.process.wait()
+
+def traced(method):
+    '''Tags the frames played during an Animation method with its name and first argument (for FrameTrace).
+    Calls made from inside another traced call keep the outer tag.'''
+    @wraps(method)
+    def wrapper(self,*args,**kwargs):
+        if self.call is not None:
+            return method(self,*args,**kwargs)
+        self.call = method.__name__,(args[0] if args and isinstance(args[0],str) else '')
+        try:
+            return method(self,*args,**kwargs)
+        finally:
+            self.call = None
+    return wrapper
+
+def merge_rects(rects):
+    '''Merges overlapping rects so that no area gets redrawn twice. Returns a new list.'''
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        i = rect.collidelist(merged)
+        while i != -1: # keep absorbing until nothing overlaps
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+def points_along(path,spacing,first=False) -> list:
+    '''Points spacing apart (by distance) along a polyline given as (x, y) points,
+    starting spacing past its first point (or on it if first = True). Coordinates are rounded to ints.'''
+    points = [tuple(path[0])] if first else []
+    travelled = 0 # distance along the path to the start of the current segment
+    target = spacing
+    for (x0,y0),(x1,y1) in zip(path,path[1:]):
+        length = hypot(x1-x0,y1-y0)
+        while target <= travelled+length+1e-9:
+            t = (target-travelled)/length
+            points.append((int(round(x0+(x1-x0)*t)),int(round(y0+(y1-y0)*t))))
+            target += spacing
+        travelled += length
+    return points
+
+class Tween:
+    '''A change spread over a number of frames. update is called every frame with the progress (0 to 1],
+    and done (optional) is called once after the last frame. Tweens are advanced by Animation.step.
+    alias is the item being changed, or a list of them for group changes. exact = True makes a seek still advance it
+    one frame at a time (along with every other tween), for updates whose result depends on how they are split up.'''
+    def __init__(self,alias,frames,update,done=None,exact=False):
+        self.alias = alias
+        self.frames = max(1,int(frames))
+        self.frame = 0
+        self.update = update
+        self.done = done
+        self.exact = exact
+
+    def advance(self,frames=1):
+        '''Moves the tween forward by frames frames (1 unless seeking), calling update once.'''
+        self.frame = min(self.frame+frames,self.frames)
+        self.update(self.frame/self.frames)
+        if self.finished and self.done is not None:
+            self.done()
+
+    @property
+    def finished(self) -> bool:
+        return self.frame >= self.frames
+
+    def __repr__(self):
+        return 'Tween(%r, %d/%d)' % (self.alias,self.frame,self.frames)
 
 class Animation:
     '''2D animation tools for pygame, including a dictionary for dirty rect animation.'''
-    def __init__(self,width,height,fps,background,font_name='cambria',font_size=24):
-        '''Also initializes clock and dirty_rect dictionary (which excludes the background).'''
+    def __init__(self,width,height,fps,background,font_name='cambria',font_size=24,headless=False,record=None,trace=None,seek=None,paced=False,rate=None,stream=None,until=None,sections=None):
+        '''Also initializes clock and dirty_rect dictionary (which excludes the background).
+        Changed areas are collected in self.dirty and only those get redrawn and pushed to the display.
+        Images loaded from files are trimmed to their visible pixels, but positions (x_of, y_of, move) stay those of the full image.
+        Items that stay unchanged for settle frames are flattened into a static layer under the rest (see flatten).
+        headless = True draws onto an off-screen surface and does not throttle to fps (use init(headless=True) first).
+        If record is a directory, every frame is saved there as a numbered image.
+        If stream is a video file name, every frame is encoded into it by ffmpeg as it plays (see FrameSink).
+        If trace is a file name, per-frame timings are recorded (see FrameTrace) and saved by quit.
+        seek (a section name or a time in seconds) fast-forwards to that point before anything is shown (see seek).
+        until (a section name) stops playing where that section starts, by quitting and exiting (see section).
+        sections (names, in playing order) declares every section the script will mark: section then checks each mark
+        against it, and a seek or until section must be one of them.
+        paced = True times the animation by the clock instead of by frames: every frame moves it on by however much time
+        actually passed, skipping frames when composing falls behind, so durations hold on slow machines. rate (default fps)
+        is how many frames per second are shown while paced, and can be higher than fps on fast machines.'''
         self.width = width
         self.height = height
         self.fps = fps
-        self.screen = pg.display.set_mode((self.width,self.height))
+        self.headless = headless
+        self.record = record
+        self.frame = 0 # frames played so far (fractional when paced)
+        self.paced = paced
+        self.rate = rate if paced and rate else fps
+        self.started = None # perf_counter time of frame 0 while paced
+        if headless:
+            pg.display.set_mode((1,1)) # still needed for convert and convert_alpha
+            self.screen = pg.Surface((self.width,self.height))
+        else:
+            self.screen = pg.display.set_mode((self.width,self.height))
+        if record is not None:
+            os.makedirs(record,exist_ok=True)
+        self.sink = None if stream is None else FrameSink(self.screen,fps,stream)
         self.clock = pg.time.Clock()
-        self.background = pg.image.load(background).convert()
+        self.background = assets.load(background).convert()
         self.screen.blit(self.background,(0,0))
-        pg.display.update()
+        if not headless:
+            pg.display.update()
         self.dirty_rects = {}
-        self.font = pg.font.SysFont(font_name,font_size)
+        self.dirty = [] # areas changed since the last refresh
+        self.changed = {} # alias -> last frame the item changed on
+        self.settle = fps//2 # frames an item has to stay unchanged before it joins the static layer
+        self.layer = self.background.copy() # the background with the static items flattened onto it
+        self.layered = {} # alias -> Rect of the items in layer, in drawing order
+        self.offsets = {} # alias -> (x, y) of a trimmed item's Surface within its original image
+        self.trails = {} # alias -> number of dots laid by trail so far
+        self.updated = [] # areas redrawn since the last display update
+        self.tweens = [] # active tweens, all advanced once per frame
+        self.font = font_of(font_name,font_size)
+        self.trace = None if trace is None else FrameTrace(trace)
+        self.call = None # (name, alias) of the traced call being run
+        self.composing = 0 # seconds, items and pixels of this frame's refreshes so far
+        self.blits = 0
+        self.pixels = 0
+        self.hidden = 0 # item draws skipped by this frame's refreshes, by reason
+        self.offscreen = 0
+        self.outside = 0
+        self.frame_start = time.perf_counter()
+        self.sections = {} # name -> frame it started on
+        self.seek_to = None # section name or frame being fast-forwarded to
+        self.until = until
+        self.planned = None if sections is None else list(sections) # declared section names
+        for name in (seek,until):
+            if isinstance(name,str) and self.planned is not None and name not in self.planned:
+                raise ValueError('Unknown section %r (the sections are %s)' % (name,', '.join(self.planned)))
+        if seek is not None:
+            self.seek(seek)
+
+    def seek(self,target):
+        '''Fast-forwards to a section (by name) or a time (in seconds, counted from the first frame).
+        Until then frames are only counted: nothing is drawn, presented, recorded or traced, and sleep and join
+        jump straight to the end state of each call. Everything is redrawn once the target is reached.'''
+        if isinstance(target,str):
+            if target in self.sections:
+                raise ValueError('Section %r has already played.' % target)
+            self.seek_to = target
+        elif int(round(target*self.fps)) > self.frame:
+            self.seek_to = int(round(target*self.fps))
+
+    @property
+    def seeking(self) -> bool:
+        return self.seek_to is not None
+
+    def section(self,name):
+        '''Marks the start of a named section (something seek can go to).
+        If it is the until section, the part being played is over: quits and raises SystemExit.
+        If sections were declared, name has to be the next one of them.'''
+        if self.planned is not None:
+            expected = self.planned[len(self.sections)] if len(self.sections) < len(self.planned) else None
+            if name != expected:
+                raise ValueError('Section %r was marked where %r was declared' % (name,expected))
+        self.sections[name] = self.frame
+        if self.seek_to == name:
+            self.end_seek()
+        if self.until == name:
+            self.quit()
+            exit()
+
+    def end_seek(self):
+        '''Stops seeking and redraws everything.'''
+        self.seek_to = None
+        self.refresh(full=True)
+        self.frame_start = time.perf_counter()
+        self.started = None # pacing restarts from here
+
+    def skippable(self,frames) -> int:
+        '''How many of the next frames can be played in one step: up to the seek target while seeking,
+        all of them while paced (step then only moves on by the time that actually passed), otherwise 1.'''
+        if not self.seeking:
+            return frames if self.paced else 1
+        if isinstance(self.seek_to,str):
+            return max(1,frames)
+        return max(1,min(frames,self.seek_to-self.frame-1)) # the last frame before the target is a normal step, so tweens are up to date
+
+    def quit(self):
+        '''Finishes the stream and saves the trace (printing its summary) if there are any, then quits pygame.'''
+        if self.seeking:
+            print('Never reached %r.' % self.seek_to)
+        if self.sink is not None:
+            code = self.sink.close()
+            print('Streamed %d frames%s.' % (self.sink.frames,'' if code == 0 else ' (the encoder exited with %d)' % code))
+        if self.trace is not None:
+            self.trace.save()
+            print(self.trace.summary())
+        fonts.clear() # their Fonts stop working once pygame quits, and the next section may init it again
+        texts.clear()
+        pg.quit()
 
     def wait(self):
-        '''Must be called every frame.'''
+        '''Must be called every frame. Only pushes the areas redrawn since the last frame.'''
+        if self.seeking:
+            self.frame += 1
+            if not isinstance(self.seek_to,str) and self.frame >= self.seek_to:
+                self.end_seek()
+            return
         for event in pg.event.get():
             if event.type == pg.QUIT:
-                pg.quit()
+                self.quit()
                 print('Exiting.')
                 exit()
-        self.clock.tick(self.fps)
-        pg.display.update()
+        worked = time.perf_counter()-self.frame_start
+        if not self.headless:
+            self.clock.tick(self.rate)
+        presenting = time.perf_counter()
+        if not self.headless and self.updated:
+            pg.display.update(self.updated)
+        self.updated = []
+        self.frame += 1
+        if self.record is not None:
+            pg.image.save(self.screen,os.path.join(self.record,'%06d.png' % self.frame))
+        if self.sink is not None:
+            self.sink.write(self.screen)
+        self.frame_start = time.perf_counter()
+        if self.trace is not None:
+            presenting = self.frame_start-presenting
+            call,alias = ('wait','') if self.call is None else self.call
+            self.trace.add(frame=self.frame,call=call,alias=alias,compose_ms=1000*self.composing,present_ms=1000*presenting,
+                           frame_ms=1000*(worked+presenting),items=self.blits,pixels=self.pixels,hidden=self.hidden,
+                           offscreen=self.offscreen,outside=self.outside,missed=worked+presenting > 1/self.rate)
+        self.composing = 0
+        self.blits = 0
+        self.pixels = 0
+        self.hidden = 0
+        self.offscreen = 0
+        self.outside = 0
     
-    def sleep(self,seconds):
-        '''"Sleeps" by mass waiting. Can take floats.'''
-        for i in arange(int(round(seconds*self.fps))):
+    def step(self,frames=1):
+        '''Plays one frame: waits, advances every active tween and redraws once. Returns how many frames it moved on.
+        While seeking, frames (see skippable) can be more than 1 to jump over several frames at once.
+        While paced, it moves on by the time passed since the last frame (at least 1/rate seconds), up to frames.'''
+        if self.paced and not self.seeking:
+            start = self.frame
             self.wait()
+            if self.started is None:
+                self.started = time.perf_counter()-start/self.fps
+            frames = min(frames,max((time.perf_counter()-self.started)*self.fps-start,self.fps/self.rate))
+            self.frame = start+frames
+        else:
+            self.frame += frames-1
+            self.wait()
+        exact = self.seeking and frames > 1 and any(tween.exact for tween in self.tweens)
+        for by in ([1]*frames if exact else [frames]): # exact tweens see every skipped frame, in playing order
+            for tween in self.tweens:
+                if not tween.finished:
+                    tween.advance(by)
+        for tween in self.tweens:
+            for alias in ([tween.alias] if isinstance(tween.alias,str) else tween.alias):
+                self.changed[alias] = self.frame
+        self.tweens = [tween for tween in self.tweens if not tween.finished]
+        self.refresh()
+        return frames
+
+    @traced
+    def animate(self,alias,update,frames=None,done=None,block=True,exact=False):
+        '''Queues a Tween (default length 1 second) and returns it. block = True (default) plays frames until it finishes,
+        while block = False returns right away so that it runs alongside later calls (see join). exact is passed to the Tween.'''
+        tween = Tween(alias,self.fps if frames is None else frames,update,done,exact)
+        self.tweens.append(tween)
+        if block:
+            self.join(tween)
+        return tween
+
+    @traced
+    def join(self,*tweens):
+        '''Plays frames until the given tweens (all active tweens if none are given) have finished.'''
+        if not tweens:
+            tweens = self.tweens[:]
+        while not all(tween.finished for tween in tweens):
+            self.step(self.skippable(max(tween.frames-tween.frame for tween in tweens)))
 
-    def move(self,alias,x=None,y=None,mode=1):
+    @traced
+    def sleep(self,seconds):
+        '''"Sleeps" by mass waiting. Can take floats. Active tweens keep playing.'''
+        frames = int(round(seconds*self.fps))
+        while frames > 1e-6: # paced steps can be fractional
+            frames -= self.step(self.skippable(frames))
+
+    @traced
+    def move(self,alias,x=None,y=None,mode=1,block=True):
         '''Gradually moves a surface in the dictionary by its top left corner.
         mode = 0 means instant (1 is default; 1 second). If x or y
-        are left as None, no change along the respective axis will occur.'''
+        are left as None, no change along the respective axis will occur.
+        block = False returns the Tween without waiting for it.'''
         rect = self.dirty_rects[alias][1]
-        deltaX = 0 if x is None else x-rect.left
-        deltaY = 0 if y is None else y-rect.top
+        deltaX = 0 if x is None else x-self.x_of(alias)
+        deltaY = 0 if y is None else y-self.y_of(alias)
         if mode == 0:
+            self.touch(alias)
             rect.left += deltaX
             rect.top += deltaY
+            self.touch(alias)
             self.refresh()
         elif mode == 1:
             left = rect.left
             top = rect.top
-            for i in arange(1,self.fps+1):
-                self.wait()
-                rect.left = left+deltaX*(i/self.fps)
-                rect.top = top+deltaY*(i/self.fps)
-                self.refresh()
+            def update(progress):
+                self.dirty.append(rect.copy())
+                rect.left = left+deltaX*progress
+                rect.top = top+deltaY*progress
+                self.dirty.append(rect.copy())
+            return self.animate(alias,update,block=block)
         elif isinstance(mode,int):
             raise ValueError('Mode must either be 0 or 1.')
-        self.refresh()
         
-    def erase(self,alias,mode=1):
+    @traced
+    def erase(self,alias,mode=1,block=True):
         '''Gradually erases surface and removes it from the dictionary.
-        mode = 0 means instant (1 is default; 1 second)'''
+        mode = 0 means instant (1 is default; 1 second). block = False returns the Tween without waiting for it.'''
         if mode == 0:
-            self.dirty_rects.pop(alias)
+            self.remove(alias)
             self.refresh()
         elif mode == 1:
-            self.fade(alias)
-            self.dirty_rects.pop(alias)
-            self.refresh()
+            img = self.img_of(alias)
+            def done():
+                if alias in self.dirty_rects and self.img_of(alias) is img: # not replaced in the meantime
+                    self.remove(alias)
+            return self.fade(alias,done=done,block=block)
         elif isinstance(mode,int):
             raise ValueError('Mode must either be 0 or 1')
 
+    @traced
     def add(self,img,alias=None,x=0,y=0,vis=True):
         '''Creates an item in the dictionary, with an initial position according to its center.
         img can either be a string file name or a Surface object. If img is a file name and no alias is given,
         default alias is the file name without extension. The purpose of aliases is to enable duplicates.
-        vis = True (default) means alpha = 255, while vis = False means alpha = 0 (transparent)'''
+        vis = True (default) means alpha = 255, while vis = False means alpha = 0 (transparent)
+        Transparent borders of file images are trimmed off, so only visible pixels get blended.'''
+        offset = 0,0
         if isinstance(img,str):
             if alias is None:
                 alias = img.split('.')[0]
-            img = pg.image.load(img).convert_alpha() # Surface
+            img,offset = assets.trimmed(img)
+            img = img.copy() # Surface; a copy so alpha and pixel changes stay with this item
         elif not isinstance(img,pg.Surface):
             raise TypeError('img must either be a file name or a Surface object.')
         if not isinstance(alias,str):
             raise TypeError('Alias must be None or str.')
-        self.dirty_rects[alias] = img,img.get_rect() # dictionary with keys being str and values being tuples of Surface, Rect
+        if alias in self.dirty_rects: # replacing an item, so its old area has to be cleared
+            self.touch(alias)
+        self.dirty_rects[alias] = img,img.get_rect(topleft=offset) # dictionary with keys being str and values being tuples of Surface, Rect
+        self.offsets[alias] = offset
         if not vis:
             self.dirty_rects[alias][0].set_alpha(0)
         self.move(alias,x,y,0)
-        self.screen.blit(img,(self.dirty_rects[alias][1].left,self.dirty_rects[alias][1].top))
     
-    def add_fade(self,img,alias=None,x=0,y=0):
+    @traced
+    def add_fade(self,img,alias=None,x=0,y=0,block=True):
         '''Adds img item while fading it in. Default alias is file name without extension.'''
         self.add(img,alias,x,y,vis=False)
         if isinstance(img,str) and alias is None:
             alias = img.split('.')[0]
-        self.fade(alias)
+        return self.fade(alias,block=block)
     
     def img_of(self,key) -> pg.Surface:
         return self.dirty_rects[key][0]
@@ -107,17 +597,115 @@ class Animation:
         return self.dirty_rects[key][1]
     
     def x_of(self,key) -> int:
-        return self.dirty_rects[key][1].left
+        '''Left edge of the item's full (untrimmed) image.'''
+        return self.dirty_rects[key][1].left-self.offsets.get(key,(0,0))[0]
     
     def y_of(self,key) -> int:
-        return self.dirty_rects[key][1].top
+        '''Top edge of the item's full (untrimmed) image.'''
+        return self.dirty_rects[key][1].top-self.offsets.get(key,(0,0))[1]
+
+    def expand(self,alias,area) -> pg.Rect:
+        '''Pads a trimmed item's Surface with transparent pixels so that it covers area (a Rect relative to
+        the top left of the full image). Returns area relative to the item's Surface, for editing it in place.
+        The Surface is replaced when it grows, so don't expand an item while it is fading.'''
+        img,rect = self.dirty_rects[alias]
+        dx,dy = self.offsets.get(alias,(0,0))
+        bounds = img.get_rect().union(area.move(-dx,-dy))
+        if bounds != img.get_rect():
+            grown = pg.Surface(bounds.size,pg.SRCALPHA,img)
+            grown.fill((0,0,0,0))
+            inner = img.get_rect(topleft=(-bounds.left,-bounds.top))
+            pg.surfarray.pixels3d(grown)[inner.left:inner.right,inner.top:inner.bottom] = pg.surfarray.pixels3d(img) # exact copy, no blending
+            pg.surfarray.pixels_alpha(grown)[inner.left:inner.right,inner.top:inner.bottom] = pg.surfarray.pixels_alpha(img)
+            grown.set_alpha(img.get_alpha())
+            self.touch(alias)
+            dx,dy = dx+bounds.left,dy+bounds.top
+            rect.update(rect.left+bounds.left,rect.top+bounds.top,bounds.width,bounds.height) # in place, for moves in progress
+            self.dirty_rects[alias] = grown,rect
+            self.offsets[alias] = dx,dy
+        return area.move(-dx,-dy)
     
-    def refresh(self):
-        '''Redraws all objects.'''
-        self.screen.blit(self.background,(0,0))
-        for value in self.dirty_rects.values():
-            self.screen.blit(value[0],(value[1].left,value[1].top))
+    def touch(self,alias):
+        '''Marks the current area of an item as changed, so the next refresh redraws it.
+        Call this after editing an item's Surface in place (e.g. with img_of).'''
+        self.dirty.append(self.dirty_rects[alias][1].copy())
+        self.changed[alias] = self.frame
+
+    def remove(self,alias):
+        '''Instantly removes an item from the dictionary (without refreshing) and returns its Surface, Rect.'''
+        self.touch(alias)
+        self.offsets.pop(alias,None)
+        return self.dirty_rects.pop(alias)
+
+    def refresh(self,full=False):
+        '''Redraws the areas that changed since the last refresh (all objects if full = True).
+        Redrawn areas are pushed to the display on the next wait. Nothing is drawn while seeking.
+        Items that are fully transparent, off-screen or outside every redrawn area are skipped (and counted for the trace).'''
+        if self.seeking:
+            self.dirty = []
+            return
+        start = time.perf_counter()
+        if full:
+            self.dirty = [self.screen.get_rect()]
+        if not self.dirty:
+            return
+        self.flatten()
+        screen = self.screen.get_rect()
+        areas = [area for area in merge_rects(rect.clip(screen) for rect in self.dirty) if area.width and area.height] # not off-screen
+        self.dirty = []
+        drawable = []
+        for alias,(img,rect) in self.dirty_rects.items():
+            if alias in self.layered:
+                continue
+            if img.get_alpha() == 0:
+                self.hidden += 1
+            elif not rect.colliderect(screen):
+                self.offscreen += 1
+            elif rect.collidelist(areas) == -1:
+                self.outside += 1
+            else:
+                drawable.append((img,rect))
+        for area in areas:
+            self.screen.set_clip(area)
+            self.screen.blit(self.layer,area,area)
+            self.pixels += area.width*area.height
+            for img,rect in drawable:
+                if rect.colliderect(area):
+                    self.screen.blit(img,rect)
+                    drawn = rect.clip(area)
+                    self.blits += 1
+                    self.pixels += drawn.width*drawn.height
+            self.updated.append(area)
+        self.screen.set_clip(None)
+        self.composing += time.perf_counter()-start
     
+    def flatten(self):
+        '''Updates the static layer. An item belongs in it once it has been unchanged for settle frames,
+        as long as it doesn't overlap an earlier item that is drawn separately (so drawing order is kept).
+        Only the areas of items joining or leaving the layer are redrawn on it.
+        Fully transparent and off-screen items draw nothing, so they are left out of both.'''
+        static = {}
+        separate = [] # rects of the items drawn every refresh
+        screen = self.screen.get_rect()
+        for alias,(img,rect) in self.dirty_rects.items():
+            if img.get_alpha() == 0 or not rect.colliderect(screen):
+                continue
+            if self.frame-self.changed.get(alias,self.frame-self.settle) >= self.settle and rect.collidelist(separate) == -1:
+                static[alias] = rect.copy()
+            else:
+                separate.append(rect)
+        areas = [rect for alias,rect in self.layered.items() if static.get(alias) != rect]
+        areas += [rect for alias,rect in static.items() if self.layered.get(alias) != rect]
+        self.layered = static
+        for area in merge_rects(area.clip(self.layer.get_rect()) for area in areas):
+            self.layer.set_clip(area)
+            self.layer.blit(self.background,area,area)
+            for alias,rect in static.items():
+                if rect.colliderect(area):
+                    self.layer.blit(self.dirty_rects[alias][0],rect)
+        self.layer.set_clip(None)
+
+    @traced
     def clone(self,alias,new_alias=None,x=None,y=None,vis=True):
         '''Clones an item in the dictionary, defaultly creating a new alias with a numerical increment.
         x and y can optionally be used to set a new position. vis = True (default) means alpha = 255, 
@@ -139,47 +727,183 @@ class Animation:
         elif alias == new_alias:
             raise ValueError("Clone's name must be different.")
         self.dirty_rects[new_alias] = self.dirty_rects[alias][0].copy(),self.dirty_rects[alias][1].copy()
+        self.offsets[new_alias] = self.offsets.get(alias,(0,0))
+        self.touch(new_alias)
         if not vis:
             self.dirty_rects[new_alias][0].set_alpha(0)
         self.move(new_alias,x,y,0)
     
-    def fade(self,alias,mode=1):
+    @traced
+    def trail(self,alias,img,path,spacing=10,speed=200,first=False,block=True):
+        '''Lays a trail of dots along path (a polyline of (x, y) positions): every spacing/speed seconds a new dot
+        appears spacing pixels further along (first = True also puts one on the first point right away).
+        img is a file name or Surface; all the dots of a call share one copy of it, so they are cheap to add.
+        Dots are items named alias+'.'+n (n counting up from 1 across calls, so a trail can be continued),
+        which makes alias+'.0' a good name for a head item added beforehand. erase_trail removes them again.
+        block = False returns the Tween without waiting for it.'''
+        offset = 0,0
+        if isinstance(img,str):
+            img,offset = assets.trimmed(img)
+        sprite = img.copy()
+        points = points_along(path,spacing,first)
+        interval = spacing/speed*self.fps # frames between dots
+        def lay(x,y):
+            self.trails[alias] = self.trails.get(alias,0)+1
+            name = '%s.%d' % (alias,self.trails[alias])
+            self.dirty_rects[name] = sprite,sprite.get_rect(topleft=(x+offset[0],y+offset[1]))
+            self.offsets[name] = offset
+            self.touch(name)
+        if first:
+            lay(*points.pop(0))
+            self.refresh()
+        laid = [0]
+        frames = int(round(len(points)*interval))
+        def update(progress):
+            frame = int(round(progress*frames))
+            while laid[0] < len(points) and int(round((laid[0]+1)*interval)) <= frame:
+                lay(*points[laid[0]])
+                laid[0] += 1
+        return self.animate(alias,update,frames,block=block)
+
+    @traced
+    def erase_trail(self,alias,mode=1,block=True):
+        '''Removes the dots of a trail (and its alias+'.0' head item, if any) in the order they appeared.
+        mode = 0 removes them all at once, while mode = 1 (default) removes one per frame.
+        block = False returns the Tween without waiting for it (None if there was nothing to remove).'''
+        names = sorted(self.members(alias),key=lambda name: int(name[len(alias)+1:]))
+        self.trails.pop(alias,None)
+        if not names:
+            return None
+        if mode == 0:
+            for name in names:
+                self.remove(name)
+            self.refresh()
+        elif mode == 1:
+            self.remove(names[0]) # the first one goes right away, like an instant erase
+            self.refresh()
+            removed = [1]
+            def update(progress):
+                while removed[0] < min(1+int(round(progress*len(names))),len(names)):
+                    self.remove(names[removed[0]])
+                    removed[0] += 1
+            return self.animate(alias,update,len(names),block=block)
+        else:
+            raise ValueError('Mode must either be 0 or 1')
+
+    def members(self,group) -> list:
+        '''Aliases in a group, in drawing order. group is either a list of aliases or a name standing for every alias
+        that is the name followed by a number (e.g. 'pt' for pt1, pt2, ... and 'current' for the trail current.0, current.1, ...).'''
+        if not isinstance(group,str):
+            return [alias for alias in group if alias in self.dirty_rects]
+        pattern = re.compile(re.escape(group)+r'\.?\d+')
+        return [alias for alias in self.dirty_rects if pattern.fullmatch(alias)]
+
+    @traced
+    def erase_group(self,group,mode=1,block=True):
+        '''Erases every item of a group (see members) at once, in one update per frame.
+        mode = 0 means instant (1 is default; 1 second). block = False returns the Tween without waiting for it.'''
+        names = self.members(group)
+        if mode == 0:
+            for alias in names:
+                self.remove(alias)
+            self.refresh()
+        elif mode == 1:
+            imgs = [self.img_of(alias) for alias in names]
+            def done():
+                for alias,img in zip(names,imgs):
+                    if alias in self.dirty_rects and self.img_of(alias) is img: # not replaced in the meantime
+                        self.remove(alias)
+            return self.fade_group(names,done=done,block=block)
+        elif isinstance(mode,int):
+            raise ValueError('Mode must either be 0 or 1')
+
+    @traced
+    def fade_group(self,group,mode=1,done=None,block=True):
+        '''Fades every item of a group (see members) in or out at once, each depending on its current alpha.
+        Items sharing a Surface (like trail dots) fade together. mode = 0 means instant (1 is default; 1 second).
+        done is called once the fade finishes. block = False returns the Tween without waiting for it.'''
+        names = self.members(group)
+        imgs = list({id(self.img_of(alias)): self.img_of(alias) for alias in names}.values()) # each Surface once
+        if mode == 0:
+            for img in imgs:
+                img.set_alpha(255 if img.get_alpha() == 0 else 0)
+            for alias in names:
+                self.touch(alias)
+            self.refresh()
+        elif mode == 1:
+            fadeIns = [img.get_alpha() == 0 for img in imgs]
+            rects = [self.rect_of(alias) for alias in names]
+            def update(progress):
+                for img,fadeIn in zip(imgs,fadeIns):
+                    img.set_alpha(int(round(255*progress if fadeIn else 255-255*progress)))
+                self.dirty.extend(rect.copy() for rect in rects)
+            return self.animate(names,update,done=done,block=block)
+        elif isinstance(mode,int):
+            raise ValueError('Mode must either be 0 or 1')
+
+    @traced
+    def move_group(self,group,dx=0,dy=0,mode=1,block=True):
+        '''Moves every item of a group (see members) by dx, dy at once.
+        mode = 0 means instant (1 is default; 1 second). block = False returns the Tween without waiting for it.'''
+        names = self.members(group)
+        rects = [self.rect_of(alias) for alias in names]
+        if mode == 0:
+            for alias,rect in zip(names,rects):
+                self.touch(alias)
+                rect.move_ip(dx,dy)
+                self.touch(alias)
+            self.refresh()
+        elif mode == 1:
+            starts = [rect.topleft for rect in rects]
+            def update(progress):
+                for rect,(left,top) in zip(rects,starts):
+                    self.dirty.append(rect.copy())
+                    rect.left = left+dx*progress
+                    rect.top = top+dy*progress
+                    self.dirty.append(rect.copy())
+            return self.animate(names,update,block=block)
+        elif isinstance(mode,int):
+            raise ValueError('Mode must either be 0 or 1')
+
+    @traced
+    def fade(self,alias,mode=1,done=None,block=True):
         '''Either fades in or out an item, depending on its current overall alpha.
-        mode = 0 means instant (1 is default; 1 second)'''
+        mode = 0 means instant (1 is default; 1 second). done is called once the fade finishes.
+        block = False returns the Tween without waiting for it.'''
         if mode == 0:
             if self.dirty_rects[alias][0].get_alpha() == 0:
                 self.dirty_rects[alias][0].set_alpha(255)
             else:
                 self.dirty_rects[alias][0].set_alpha(0)
+            self.touch(alias)
             self.refresh()
         elif mode == 1:
-            if self.dirty_rects[alias][0].get_alpha() == 0:
-                for i in arange(1,self.fps+1):
-                    self.wait()
-                    self.dirty_rects[alias][0].set_alpha(int(round(255*i/self.fps)))
-                    self.refresh()
-            else:
-                for i in arange(1,self.fps+1):
-                    self.wait()
-                    self.dirty_rects[alias][0].set_alpha(int(round(255-255*(i/self.fps))))
-                    self.refresh()
+            img,rect = self.dirty_rects[alias]
+            fadeIn = img.get_alpha() == 0
+            def update(progress):
+                img.set_alpha(int(round(255*progress if fadeIn else 255-255*progress)))
+                self.dirty.append(rect.copy())
+            return self.animate(alias,update,done=done,block=block)
         elif isinstance(mode,int):
             raise ValueError('Mode must either be 0 or 1')
     
+    @traced
     def add_text(self,alias,string,x=0,y=0,vis=True,color=(0,0,0),font=None):
         '''Shortcut for adding text; spinoff of the add method.
         Default font color is black. Default font is self.font.'''
         if font is None:
             font = self.font
-        self.add(font.render(string,True,color),alias,x,y,vis)
+        self.add(texts.render(font,string,color),alias,x,y,vis)
     
-    def add_fade_text(self,alias,string,x=0,y=0,color=(0,0,0),font=None):
+    @traced
+    def add_fade_text(self,alias,string,x=0,y=0,color=(0,0,0),font=None,block=True):
         '''Adds text item while fading it in. Default font color is black. Default font is self.font.'''
         if font is None:
             font = self.font
         self.add_text(alias,string,x,y,vis=False,color=color,font=font)
-        self.fade(alias)
+        return self.fade(alias,block=block)
     
+    @traced
     def replace(self,alias,new_img,new_alias=None,mode=1,vis=True):
         '''Replaces item and its img. mode = 0 means instant, while mode = 1 means fade out and in (default).
         vis option only applies to mode = 0. New alias is optional (will otherwise reuse alias)'''
@@ -188,7 +912,7 @@ class Animation:
                     self.add(new_img,alias,self.x_of(alias),self.y_of(alias),vis)
             elif isinstance(new_alias,str):
                 self.add(new_img,new_alias,self.x_of(alias),self.y_of(alias),vis)
-                self.dirty_rects.pop(alias)
+                self.remove(alias)
         elif mode == 1:
             if self.img_of(alias).get_alpha != 0:
                 self.fade(alias)
@@ -196,10 +920,11 @@ class Animation:
                 self.add_fade(new_img,alias,self.x_of(alias),self.y_of(alias))
             elif isinstance(new_alias,str):
                 self.add_fade(new_img,new_alias,self.x_of(alias),self.y_of(alias))
-                self.dirty_rects.pop(alias)
+                self.remove(alias)
         else:
             raise ValueError('Mode must either be 0 or 1')
     
+    @traced
     def replace_text(self,alias,new_string,new_alias=None,mode=1,color=(0,0,0),vis=True):
         '''Replaces text item and its img. mode = 0 means instant, while mode = 1 means fade out and in (default).
         Default color is black. Can only use default font.
@@ -209,7 +934,7 @@ class Animation:
                 self.add_text(alias,new_string,self.x_of(alias),self.y_of(alias),vis,color=color)
             elif isinstance(new_alias,str):
                 self.add_text(new_alias,new_string,self.x_of(alias),self.y_of(alias),vis,color=color)
-                self.dirty_rects.pop(alias)
+                self.remove(alias)
         elif mode == 1:
             if self.img_of(alias).get_alpha != 0:
                 self.fade(alias)
@@ -217,21 +942,44 @@ class Animation:
                 self.add_fade_text(alias,new_string,self.x_of(alias),self.y_of(alias),color=color)
             elif isinstance(new_alias,str):
                 self.add_fade_text(new_alias,new_string,self.x_of(alias),self.y_of(alias),color=color)
-                self.dirty_rects.pop(alias)
+                self.remove(alias)
         else:
             raise ValueError('Mode must either be 0 or 1')
 
     def __str__(self):
         return str(self.dirty_rects)
 
-def main():
-    pg.init() # ignore pylint, this works fine
-    a = Animation(1000,1000,40,'background.jpg') # make sure you are in the right working directory (cd icanim)
-    input('Hit enter to start.')
+SECTIONS = [ # (name, images first used in it) for every section main marks, in playing order
+    ('title',[]),
+    ('semiconductors',['orbitaltoband1.png','orbitaltoband2.png','orbitaltoband3.png','fermi1.png','fermi3.png','fermi7.png',
+                       'fermi2.png','fermi4.png','fermi5.png','fermi6.png']),
+    ('p-n-junction',['pn1.png','pn2.png','pn3.png','pnclose1.png','pnclose2.png','pnclose3.png','pnclose4.png','pn4.png']),
+    ('transistors',['transistor1.png','transistor4.png','transistor2.png','transistor3.png','transistor5.png']),
+    ('cmos',[]),
+    ('cmos-inverter',['cmos1.png','cmos2.png']),
+    ('manufacturing',[])]
+
+def sections() -> list:
+    '''Names of the sections main marks, in playing order.'''
+    return [name for name,names in SECTIONS]
+
+def main(headless=False,record=None,trace=None,seek=None,paced=False,stream=None,until=None):
+    '''Driver program for the animation. headless = True renders as fast as possible without a window,
+    record (a directory) saves every frame there, stream (a video file name) encodes them into it with ffmpeg,
+    trace (a .csv or .json file name) saves per-frame timings,
+    seek (a section name below or a time in seconds) starts playing from there, until (a section name) stops there
+    (raising SystemExit), and paced = True keeps to the clock (see Animation), e.g. to stay in sync with narration.'''
+    init(headless)
+    a = Animation(1000,1000,40,'background.jpg',headless=headless,record=record,trace=trace,seek=seek,paced=paced,stream=stream,until=until,
+                  sections=sections()) # make sure you are in the right working directory (cd icanim)
+    assets.preload([name for section,names in SECTIONS for name in names]) # decodes the images while waiting
+    if not headless:
+        input('Hit enter to start.')
     # a.add_text('cap1','',x=20) # for testing
     # a.add_text('cap2','',x=20,y=34) # for testing
     # a.add_text('cap3','',x=20,y=68) # for testing
-    a.add_fade_text('title','Intro to IC',x=350,y=450,font=pg.font.SysFont('cambria',72))
+    a.section('title')
+    a.add_fade_text('title','Intro to IC',x=350,y=450,font=font_of('cambria',72))
     a.add_fade_text('by','by Emerson Yu',x=420,y=545)
     a.sleep(2)
     a.erase('by')
@@ -239,6 +987,7 @@ def main():
     a.add_fade_text('cred','made with pygame and VPython',x=345,y=485)
     a.sleep(2)
     a.erase('cred')
+    a.section('semiconductors')
     a.add_fade_text('section','1. Semiconductors',x=410,y=485)
     a.sleep(2)
     a.erase('section')
@@ -254,10 +1003,8 @@ def main():
     a.add_fade_text('cap2','lowest-energy unoccupied band (conduction band) is the band gap.',x=20,y=34)
     a.add_fade('orbitaltoband3.png',x=480)
     a.sleep(4)
-    a.erase('orbitaltoband1',mode=0)
-    a.erase('orbitaltoband2',mode=0)
-    a.erase('orbitaltoband3',mode=0)
-    a.fade('cap2')
+    a.erase_group('orbitaltoband',0)
+    a.fade('cap2',block=False)
     a.replace_text('cap1','The Fermi level is the total potential energy for a system of electrons at 0 K.')
     a.add_fade('fermi1.png')
     a.add_fade('fermi3.png',x=426)
@@ -276,7 +1023,7 @@ def main():
     a.move('fermi7',y=-100)
     a.erase('fermi7',0)
     a.fade('fermi3')
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','Conductors have no band gap. Their electrons are completely delocalized.')
     a.add_fade('fermi2.png',x=130)
     a.add_fade('fermi7.png',x=166,y=480)
@@ -288,13 +1035,13 @@ def main():
     a.fade('cap2')
     a.add_fade('fermi4.png',x=722)
     a.sleep(2)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','Intrinsic semiconductors (e.g. silicon) have a small band gap, so they are less conductive')
     a.replace_text('cap2','than conductors but more conductive than insulators.',mode=0,vis=False)
     a.fade('cap2')
     a.fade('fermi3')
     a.sleep(2)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','However, they can be doped by adding impurities, becoming extrinsic semiconductors.')
     a.sleep(2)
     a.replace_text('cap1','Doped semiconductors can be p-type or n-type.')
@@ -316,7 +1063,7 @@ def main():
     a.sleep(0.5)
     a.move('fermi7',y=-100)
     a.fade('fermi7')
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','In n-type (e.g. silicon + phosphorus), the dopant atoms have one more electron per atom')
     a.replace_text('cap2','serving as a charge carrier.',mode=0,vis=False)
     a.fade('cap2')
@@ -334,11 +1081,11 @@ def main():
         a.move('fermi7',y=660+5*(-1)**i,mode=0)
     a.move('fermi7',y=400)
     a.erase('fermi7')
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','Either way, doping makes it easier for electrons to bridge the gap, improving conductivity.')
     a.sleep(2)
-    for i in arange(1,7):
-        a.erase('fermi'+str(i),0)
+    a.erase_group('fermi',0)
+    a.section('p-n-junction')
     a.replace_text('cap1','When a p-type and an n-type are placed next to each other, a p-n junction forms.')
     a.add_fade('pn1.png',x=57)
     a.add_fade('pn2.png',x=600)
@@ -351,8 +1098,7 @@ def main():
     a.add_fade('pn3.png',x=101)
     a.sleep(3)
     a.replace_text('cap1',"Let's zoom in to see how this happens.")
-    for i in arange(1,4):
-        a.fade('pn'+str(i),0)
+    a.fade_group('pn',0)
     a.add('pnclose1.png')
     a.add('pnclose2.png',x=285)
     a.add('pnclose3.png',x=685)
@@ -362,7 +1108,7 @@ def main():
     a.move('pnclose3',485)
     a.move('pnclose2',485)
     a.sleep(5)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','The charge carriers cancel out each other in recombination.')
     a.replace_text('cap2',"Positive holes are filled, while the 'extra' electrons are no longer mobile.",mode=0,vis=False)
     a.fade('cap2')
@@ -370,16 +1116,14 @@ def main():
     a.move('pnclose3',685)
     a.add_fade('pnclose4.png',x=265)
     a.sleep(4)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','These charged areas near the junction are depleted of charge carriers, hence they form')
     a.replace_text('cap2','the depletion layer.',mode=0,vis=False)
     a.fade('cap2')
     a.sleep(3)
-    for i in arange(1,5):
-        a.erase('pnclose'+str(i),0)
-    for i in arange(1,4):
-        a.fade('pn'+str(i),0)
-    a.fade('cap2')
+    a.erase_group('pnclose',0)
+    a.fade_group('pn',0)
+    a.fade('cap2',block=False)
     a.replace_text('cap1','The consequent electric field stops further diffusion.')
     a.sleep(2)
     a.replace_text('cap1',"Then, attaching a battery's positive terminal to the p-type and the negative terminal to")
@@ -391,15 +1135,15 @@ def main():
     for i in arange(6):
         a.move('pn4',1200)
         a.move('pn4',-300,mode=0)
-    a.fade('cap3')
-    a.fade('cap2')
+    a.fade('cap3',block=False)
+    a.fade('cap2',block=False)
     a.replace_text('cap1','Thus, a p-n junction can serve as a diode (one-way conductor).')
     a.sleep(2)
-    for i in arange(1,5):
-        a.erase('pn'+str(i),0)
+    a.erase_group('pn',0)
     a.replace_text('cap1','This behavior is crucial for transistors.')
     a.sleep(2)
     a.fade('cap1')
+    a.section('transistors')
     a.add_fade_text('section','2. Transistors',x=415,y=485)
     a.sleep(2)
     a.erase('section')
@@ -411,14 +1155,14 @@ def main():
     a.fade('cap2')
     a.add_fade('transistor1.png')
     a.sleep(3)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','We will be using this n-type MOSFET (NMOS) as an example.')
     a.sleep(1.5)
     a.replace_text('cap1','Note that the source and drain wells are doped oppositely in respect to the body,')
     a.replace_text('cap2','forming a depletion region that blocks current from flowing between the drain and source.',mode=0,vis=False)
     a.fade('cap2')
     a.sleep(5)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','With application of high voltage, the gate acts as a capacitor and generates an electric field.')
     a.replace_text('cap2','This voltage has to be high enough for the electric field to attract enough electrons, though, ',mode=0,vis=False)
     a.fade('cap2')
@@ -426,14 +1170,14 @@ def main():
     a.fade('cap3')
     a.add_fade('transistor4.png',x=170,y=300)
     a.sleep(6)
-    a.fade('cap3')
-    a.fade('cap2')
+    a.fade('cap3',block=False)
+    a.fade('cap2',block=False)
     a.replace_text('cap1',"Attracted by the electric field, electrons near the insulator delocalize.")
     a.replace_text('cap2','The accumulation of electrons counters the electric field, and a channel is created.',mode=0,vis=False)
     a.fade('cap2')
     a.add_fade('transistor2.png',x=520)
     a.sleep(5)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1',"This channel, of opposite type to the body, allows current to flow from the drain to the source.")
     a.replace_text('cap2','(high to low voltage) This is called linear operation mode.',mode=0,vis=False)
     a.fade('cap2')
@@ -442,7 +1186,7 @@ def main():
     a.fade('pn4')
     a.sleep(4)
     a.erase('pn4')
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1',"However, applying too high a voltage leads to saturation mode, where current cannot flow.")
     a.move('transistor2',x=330)
     a.sleep(3)
@@ -457,8 +1201,8 @@ def main():
     a.fade('cap3')
     a.add_fade('transistor5.png',x=170,y=300)
     a.sleep(6)
-    a.fade('cap3')
-    a.fade('cap2')
+    a.fade('cap3',block=False)
+    a.fade('cap2',block=False)
     a.replace_text('cap1',"Current flows from source to drain in a PMOS (still high to low voltage, just other direction).")
     a.add_fade('pn4.png',x=520,y=670)
     a.sleep(2)
@@ -469,6 +1213,7 @@ def main():
     a.erase('transistor5',0)
     a.erase('transistor3')
     a.sleep(1)
+    a.section('cmos')
     a.replace_text('cap1',"Complementary metal-oxide semiconductor (CMOSs) are often used to implement logic.")
     a.sleep(2)
     a.replace_text('cap1',"They are made up of PMOSs and NMOSs and follow these two rules:")
@@ -477,80 +1222,38 @@ def main():
     a.replace_text('cap3',"2. All NMOSs get input from 'ground' (set as 0 V for the system) or another NMOS",mode=0,vis=False)
     a.fade('cap3')
     a.sleep(5)
-    a.fade('cap3')
-    a.fade('cap2')
+    a.fade('cap3',block=False)
+    a.fade('cap2',block=False)
+    a.section('cmos-inverter')
     a.replace_text('cap1',"With that in mind, let's look at a CMOS inverter (NOT gate).")
     a.add_fade('cmos1.png')
     a.sleep(4)
     a.replace_text('cap1',"Let 0 = low voltage and 1 = high voltage.")
     a.sleep(2)
-    font = pg.font.SysFont('cambria',48)
+    font = font_of('cambria',48)
     a.add_fade_text('in1','1',x=30,y=855,font=font)
     a.replace_text('cap1',"When the input is 1, at the PMOS, VGS = Vin - Vdd does not reach its negative threshold,")
     a.replace_text('cap2','so the PMOS stays in cutoff mode and does not contribute to the output.',mode=0,vis=False)
     a.fade('cap2')
-    a.add_fade('cmos2.png',x=127,y=565)
-    for i in arange(1,11):
-        a.sleep(0.05)
-        a.clone('cmos'+str(1+int(i)),x=127+10*i)
-    for i in arange(1,17):
-        a.sleep(0.05)
-        a.clone('cmos'+str(11+int(i)),y=565-10*i)
-    for i in arange(1,12):
-        a.sleep(0.05)
-        a.clone('cmos'+str(27+int(i)),x=227+10*i)
-    i=0
-    while 1:
-        try:
-            a.erase('cmos'+str(2+i),0)
-        except KeyError:
-            break
-        else:
-            i += 1
-            a.wait()
+    a.add_fade('cmos2.png','current.0',x=127,y=565)
+    a.trail('current','cmos2.png',[(127,565),(227,565),(227,405),(337,405)])
+    a.erase_trail('current')
     a.sleep(4)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1',"However, at the NMOS, VGS = Vin - 0 reaches its positive threshold, turning it to")
     a.replace_text('cap2','linear operation.',mode=0,vis=False)
     a.fade('cap2')
-    a.add_fade('cmos2.png',x=127,y=565)
-    for i in arange(1,11):
-        a.sleep(0.05)
-        a.clone('cmos'+str(1+int(i)),x=127+10*i)
-    for i in arange(1,17):
-        a.sleep(0.05)
-        a.clone('cmos'+str(11+int(i)),y=565+10*i)
-    for i in arange(1,12):
-        a.sleep(0.05)
-        a.clone('cmos'+str(27+int(i)),x=227+10*i)
+    a.add_fade('cmos2.png','current.0',x=127,y=565)
+    a.trail('current','cmos2.png',[(127,565),(227,565),(227,725),(337,725)])
     a.sleep(3)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1',"The drain connects to the source, which is connected to ground, thus the NMOS contributes")
     a.replace_text('cap2','0 as ouput, since current flows from high to low potential.',mode=0,vis=False)
     a.fade('cap2')
-    for i in arange(1,4):
-        a.sleep(0.05)
-        a.clone('cmos'+str(38+int(i)),x=337+10*i)
-    for i in arange(1,4):
-        a.sleep(0.05)
-        a.clone('cmos'+str(41+int(i)),y=725+10*i)
-    for i in arange(1,27):
-        a.sleep(0.05)
-        a.clone('cmos'+str(44+int(i)),x=367+10*i)
-    for i in arange(1,25):
-        a.sleep(0.05)
-        a.clone('cmos'+str(70+int(i)),y=755+10*i)
-    i=0
-    while 1:
-        try:
-            a.erase('cmos'+str(2+i),0)
-        except KeyError:
-            break
-        else:
-            i += 1
-            a.wait()
+    a.trail('current','cmos2.png',[(337,725),(367,725),(367,755),(627,755),(627,995)])
+    a.erase_trail('current')
     a.sleep(4)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','Thus, an input of 1 gets an output of 0.')
     a.add_fade_text('out1','0',x=115,y=855,font=font)
     a.sleep(1)
@@ -558,95 +1261,66 @@ def main():
     a.replace_text('cap1',"When the input is 0, at the NMOS, VGS = Vin - 0 does not reach its positive threshold,")
     a.replace_text('cap2','so the NMOS stays in cutoff mode and does not contribute to the output.',mode=0,vis=False)
     a.fade('cap2')
-    a.add_fade('cmos2.png',x=127,y=565)
-    for i in arange(1,11):
-        a.sleep(0.05)
-        a.clone('cmos'+str(1+int(i)),x=127+10*i)
-    for i in arange(1,17):
-        a.sleep(0.05)
-        a.clone('cmos'+str(11+int(i)),y=565+10*i)
-    for i in arange(1,12):
-        a.sleep(0.05)
-        a.clone('cmos'+str(27+int(i)),x=227+10*i)
-    i=0
-    while 1:
-        try:
-            a.erase('cmos'+str(2+i),0)
-        except KeyError:
-            break
-        else:
-            i += 1
-            a.wait()
+    a.add_fade('cmos2.png','current.0',x=127,y=565)
+    a.trail('current','cmos2.png',[(127,565),(227,565),(227,725),(337,725)])
+    a.erase_trail('current')
     a.sleep(4)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1',"However, at the PMOS, VGS = Vin - Vdd reaches its negative threshold, turning it to linear")
     a.replace_text('cap2','operation.',mode=0,vis=False)
     a.fade('cap2')
-    a.add_fade('cmos2.png',x=127,y=565)
-    for i in arange(1,11):
-        a.sleep(0.05)
-        a.clone('cmos'+str(1+int(i)),x=127+10*i)
-    for i in arange(1,17):
-        a.sleep(0.05)
-        a.clone('cmos'+str(11+int(i)),y=565-10*i)
-    for i in arange(1,12):
-        a.sleep(0.05)
-        a.clone('cmos'+str(27+int(i)),x=227+10*i)
+    a.add_fade('cmos2.png','current.0',x=127,y=565)
+    a.trail('current','cmos2.png',[(127,565),(227,565),(227,405),(337,405)])
     a.sleep(3)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','The source connects to the drain. Since the source is connected to Vdd, the PMOS then')
     a.replace_text('cap2','contributes 1 as output.',mode=0,vis=False)
     a.fade('cap2')
-    a.clone('cmos39',x=635,y=205)
-    for i in arange(1,17):
-        a.sleep(0.05)
-        a.clone('cmos'+str(39+int(i)),y=205+10*i)
-    for i in arange(1,24):
-        a.sleep(0.05)
-        a.clone('cmos'+str(55+int(i)),x=635-10*i)
-    for i in arange(1,10):
-        a.sleep(0.05)
-        a.clone('cmos'+str(78+int(i)),y=365+10*i)
-    for i in arange(1,24):
-        a.sleep(0.05)
-        a.clone('cmos'+str(87+int(i)),x=405+10*i)
-    for i in arange(1,11):
-        a.sleep(0.05)
-        a.clone('cmos'+str(110+int(i)),y=455+10*i)
-    for i in arange(1,11):
-        a.sleep(0.05)
-        a.clone('cmos'+str(120+int(i)),x=635+10*i)
-    i=0
-    while 1:
-        try:
-            a.erase('cmos'+str(2+i),0)
-        except KeyError:
-            break
-        else:
-            i += 1
-            a.wait()
+    a.trail('current','cmos2.png',[(635,205),(635,365),(405,365),(405,455),(635,455),(635,555),(735,555)],first=True)
+    a.erase_trail('current')
     a.sleep(4)
-    a.fade('cap2')
+    a.fade('cap2',block=False)
     a.replace_text('cap1','Thus, an input of 0 gets an output of 1.')
     a.add_fade_text('out0','1',x=115,y=930,font=font)
     a.sleep(1)
     a.replace_text('cap1','Hence, this CMOS functions as a NOT gate (like a boolean operator).')
     a.sleep(2)
-    a.erase('in1',0)
-    a.erase('in0',0)
-    a.erase('out1',0)
-    a.erase('out0',0)
+    a.erase_group(['in1','in0','out1','out0'],0)
     a.erase('cmos1')
     a.replace_text('cap1','Many, many logic gates make up an integrated circuit (aka IC or chip).')
     a.sleep(2)
     a.replace_text('cap1','But how are such tiny yet extensively detailed chips made?')
     a.sleep(2)
     a.fade('cap1')
+    a.section('manufacturing')
     a.add_fade_text('section','3. Manufacturing',x=414,y=485)
     a.sleep(2)
     a.erase('section')
     a.sleep(5)
-    pg.quit()
+    a.quit()
     
+def seek_target(arg):
+    '''A command line seek target: a time in seconds if it is a number, otherwise a section name.'''
+    try:
+        return float(arg)
+    except ValueError:
+        return arg
+
+def command_line(description,names,argv=None) -> dict:
+    '''Parses the command line shared by the 2D scripts (whose sections are names) into keyword arguments for their main.
+    Recording or streaming renders headlessly. Missing or unknown arguments exit with an error.'''
+    parser = argparse.ArgumentParser(description=description+' (run from the icanim directory)')
+    parser.add_argument('--record',metavar='DIR',help='render headlessly, saving every frame in DIR')
+    parser.add_argument('--stream',metavar='FILE',help='render headlessly, encoding every frame into the video FILE with ffmpeg')
+    parser.add_argument('--headless',action='store_true',help='render as fast as possible without a window')
+    parser.add_argument('--seek',metavar='TARGET',type=seek_target,help='start from a section or a time in seconds (sections: %s)' % ', '.join(names))
+    parser.add_argument('--until',metavar='SECTION',choices=names,help='stop where this section starts')
+    parser.add_argument('--paced',action='store_true',help='keep to the clock, skipping frames when drawing falls behind')
+    parser.add_argument('--trace',metavar='FILE',help='save per-frame timings to FILE (.csv or .json)')
+    args = parser.parse_args(argv)
+    if isinstance(args.seek,str) and args.seek not in names:
+        parser.error('unknown section %r' % args.seek)
+    return dict(vars(args),headless=args.headless or args.record is not None or args.stream is not None)
+
 if __name__ == '__main__':
-    main()
+    main(**command_line('Plays the intro of the IC animation.',sections()))
@@ -0,0 +1,182 @@
+#######################
+# icanimtimeline.py
+# Emerson Yu
+# Final Project
+# Declarative timelines: a JSON file of actors and cues, compiled ahead of time into a frame-indexed schedule.
+# python icanimtimeline.py <timeline.json> prints its length and sections without playing it.
+# Only the end section (icanimend.json) is a timeline; icanimintro.py says why the intro is not.
+#######################
+
+import json, sys
+from icanimintro import assets, font_of
+
+effects = {} # name -> function(a, alias, *args, seconds=..., block=False) returning a Tween; see icanimend.dissolve
+
+ITEM = ('img','text','x','y','font','color') # what actors and enter cues describe
+
+class Timeline:
+    '''A compiled timeline. The JSON looks like
+        {"fps": 40, "actors": {"cap1": {"text": "", "x": 20}, ...},
+         "sections": [{"name": "opc", "cues": [{"do": "enter", "alias": "cap1", "text": "..."}, {"do": "hold", "seconds": 2}, ...]}, ...]}
+    Cues (all but hold and join take an alias; mode 0 is instant and 1 is one second, as in Animation):
+        enter   adds an image ("img") or text ("text", optional "font": [name, size] and "color"), fading it in unless mode is 0
+        exit    erases an item
+        fade    fades an item in or out
+        move    moves an item to "x" and/or "y"
+        caption replaces an item's text, fading the old text out first if it is showing (mode 0 swaps it instantly, "vis" false hides it)
+        effect  runs a registered effect ("name", "args", "seconds") on an item
+        hold    waits "seconds"
+        join    waits for every running tween
+    Sections only mark where they start, so tweens left running keep playing into the next section.
+    An image's alias defaults to its file name without extension. Actors give defaults (img, text, x, y, font, color) for the cues that use their alias.
+    Every cue waits for itself to finish unless it has "block": false, just like the Animation methods.
+    schedule is a list of [frame, action, arguments] in playing order, and sections a list of
+    [name, first frame, end frame, asset file names]; both can be computed and inspected without pygame.'''
+    def __init__(self,script,fps=None):
+        self.fps = script.get('fps',40) if fps is None else fps
+        self.actors = script.get('actors',{})
+        self.schedule = []
+        self.sections = []
+        self.state = {} # alias -> what the item will be when the cue being compiled starts
+        self.running = [] # end frames of the tweens started so far
+        self.frame = 0
+        for section in script['sections']:
+            start = self.frame
+            names = []
+            for number,cue in enumerate(section['cues']):
+                try:
+                    self.compile(cue,names)
+                except (KeyError,ValueError) as error:
+                    raise ValueError('Cue %d of section %r (%r): %s' % (number,section['name'],cue,error)) from None
+            self.sections.append([section['name'],start,self.frame,list(dict.fromkeys(names))])
+        self.duration = max([self.frame]+self.running) # tweens still running at the end get to finish
+        if self.sections:
+            self.sections[-1][2] = self.duration
+        del self.state,self.running
+
+    @classmethod
+    def load(cls,path,fps=None):
+        with open(path) as file:
+            return cls(json.load(file),fps)
+
+    def cue(self,action,frames=0,block=True,**arguments):
+        '''Schedules an action now; it takes frames frames, which block = True waits for.'''
+        self.schedule.append([self.frame,action,arguments])
+        if frames:
+            self.running.append(self.frame+frames)
+            if block:
+                self.frame += frames
+
+    def compile(self,cue,names):
+        '''Turns one cue into scheduled actions, updating the state the following cues see.'''
+        do = cue['do']
+        if do == 'hold':
+            self.frame += int(round(cue['seconds']*self.fps))
+            return
+        if do == 'join':
+            self.frame = max([self.frame]+self.running)
+            return
+        alias = cue['alias'] if 'alias' in cue or 'img' not in cue else cue['img'].split('.')[0] # same default as Animation.add
+        block = cue.get('block',True)
+        mode = cue.get('mode',1)
+        if mode not in (0,1):
+            raise ValueError('Mode must either be 0 or 1')
+        frames = self.fps if mode == 1 else 0
+        if do == 'enter':
+            item = {key: value for key,value in dict(self.actors.get(alias,{}),**cue).items() if key in ITEM}
+            self.place(alias,item,mode == 0,names)
+            if mode == 1:
+                self.cue('fade',frames,block,alias=alias)
+            self.state[alias]['visible'] = True
+            return
+        item = self.state[alias] # every other cue needs the item to exist
+        if do == 'exit':
+            self.cue('erase',frames,block,alias=alias,mode=mode)
+            del self.state[alias]
+        elif do == 'fade':
+            self.cue('fade',frames,block,alias=alias,mode=mode)
+            item['visible'] = not item['visible']
+        elif do == 'move':
+            item['x'] = cue.get('x',item['x'])
+            item['y'] = cue.get('y',item['y'])
+            self.cue('move',frames,block,alias=alias,x=cue.get('x'),y=cue.get('y'),mode=mode)
+        elif do == 'caption':
+            text = dict(item,text=cue['text'],color=cue.get('color',item.get('color')))
+            text.pop('img',None)
+            if mode == 0:
+                self.place(alias,text,cue.get('vis',True),names)
+                self.state[alias]['visible'] = cue.get('vis',True)
+                return
+            shown = item['visible']
+            if shown: # the new text only starts fading in once the old text is gone
+                self.cue('fade',frames,True,alias=alias,mode=1)
+            self.place(alias,text,False,names)
+            self.cue('fade',frames,True,alias=alias,mode=1)
+            self.state[alias]['visible'] = True
+            if not block: # the caption still takes its time, but later cues start with it
+                self.frame -= frames*(2 if shown else 1)
+        elif do == 'effect':
+            seconds = cue.get('seconds',1)
+            self.cue('effect',int(round(seconds*self.fps)),block,alias=alias,name=cue['name'],args=cue.get('args',[]),seconds=seconds)
+        else:
+            raise ValueError('Unknown cue %r' % do)
+
+    def place(self,alias,item,vis,names):
+        '''Schedules adding an image or text item (replacing any item with the same alias).'''
+        x,y = item.get('x',0),item.get('y',0)
+        if 'img' in item:
+            names.append(item['img'])
+            self.cue('add',img=item['img'],alias=alias,x=x,y=y,vis=vis)
+        elif 'text' in item:
+            self.cue('add_text',alias=alias,string=item['text'],x=x,y=y,vis=vis,color=item.get('color'),font=item.get('font'))
+        else:
+            raise ValueError('An item needs either img or text')
+        self.state[alias] = dict(item,x=x,y=y,visible=vis)
+
+    def play(self,a):
+        '''Plays the schedule on Animation a (whose fps should match), starting from a's current frame.
+        Each section is marked with a.section (so a can seek to it), and the next section's images
+        are decoded in the background while a section plays. Frames are traced under the latest cue still running.'''
+        base = a.frame
+        running = [] # ((action, alias), Tween) of the cues started so far that take time
+        marks = [(start,i) for i,(name,start,end,names) in enumerate(self.sections)]
+        marks += [(frame,(action,arguments)) for frame,action,arguments in self.schedule]
+        marks.sort(key=lambda mark: (mark[0],not isinstance(mark[1],int))) # stable, so sections come first and actions stay in order
+        for frame,mark in marks+[(self.duration,None)]:
+            while a.frame-base < frame-1e-6: # paced steps can be fractional
+                a.call = running[-1][0] if running else None # for FrameTrace, like traced does
+                a.step(a.skippable(frame-(a.frame-base)))
+                running = [(tag,tween) for tag,tween in running if not tween.finished]
+            a.call = None
+            if isinstance(mark,int):
+                a.section(self.sections[mark][0])
+                if mark+1 < len(self.sections):
+                    assets.preload(self.sections[mark+1][3])
+            elif mark is not None:
+                tween = self.run(a,*mark)
+                if tween is not None:
+                    action,arguments = mark
+                    running.append(((arguments['name'] if action == 'effect' else action,arguments['alias']),tween))
+
+    @staticmethod
+    def run(a,action,arguments):
+        '''Carries out one scheduled action on Animation a without waiting for it. Returns its Tween, if it has one.'''
+        arguments = dict(arguments)
+        if action == 'add':
+            a.add(**arguments)
+        elif action == 'add_text':
+            font = arguments.pop('font')
+            color = arguments.pop('color')
+            a.add_text(font=None if font is None else font_of(*font),color=(0,0,0) if color is None else tuple(color),**arguments)
+        elif action == 'effect': # effects register themselves on import, so they are only looked up when played
+            if arguments['name'] not in effects:
+                raise ValueError('Unknown effect %r' % arguments['name'])
+            return effects[arguments['name']](a,arguments['alias'],*arguments['args'],seconds=arguments['seconds'],block=False)
+        else: # fade, move and erase
+            return getattr(a,action)(block=False,**arguments)
+
+if __name__ == '__main__':
+    timeline = Timeline.load(sys.argv[1])
+    print('%d frames (%.1f s at %d fps)' % (timeline.duration,timeline.duration/timeline.fps,timeline.fps))
+    for name,start,end,names in timeline.sections:
+        print('%-20s frames %6d-%6d  %s' % (name,start,end,', '.join(names)))
@@ -1,103 +1,145 @@
-from random import randint,seed
+from hashlib import sha256
+from concurrent.futures import ProcessPoolExecutor
+import sys, time
+import numpy as np
+
+def seedOf(key):
+    '''Turns a key (any str-able value) into a 64-bit seed that is the same in every process.'''
+    return int.from_bytes(sha256(str(key).encode()).digest()[:8],'little')
 
 class Maze:
-    def __init__(self, cols=8, rows=8, key='default'):
-        '''Creates maze (2D matrix of ints) via Randomized Prim's Algorithm, given a seed for random numbers.'''
+    def __init__(self, cols=8, rows=8, key='default', rng=None):
+        '''Creates maze (2D matrix of ints) via Randomized Prim's Algorithm, given a seed for random numbers.
+        The matrix is stored as a rows x cols uint8 numpy array (self.grid, also reachable as self.maze).
+        The same key always gives the same maze. Each maze has its own numpy Generator (self.rng, seeded by key
+        unless rng is given), so no global random state is touched and mazes can be built in parallel.'''
         if cols < 3 or rows < 3:
             raise ValueError('Dimensions must be at least 3x3.')
         # 0 is undefined, 1 is wall, 2 is cell
-        seed(key)
+        self.rng = rng = np.random.default_rng(seedOf(key)) if rng is None else rng
         self.cols = cols
         self.rows = rows
-        self.maze = [[0]*cols for i in range(rows)]
-        currRow = randint(1,self.rows-2) # start (not on edge)
-        currCol = randint(1,self.cols-2)
-        self.maze[currRow][currCol] = 2 # start
-        self.makeWalls(currRow,currCol)
-        walls = self.findAdjVal(currRow,currCol,1)
-        while walls: # empty list evaluates as boolean
-            randWall = walls[randint(0,len(walls)-1)] # select wall
-            adjCells = self.findAdjVal(randWall[0],randWall[1],2)
-            if (self.inBounds(randWall[0]+1,randWall[1]+1) and
-                self.inBounds(randWall[0]-1,randWall[1]-1) and
-                ((self.maze[randWall[0]][randWall[1]+1] == 0 and self.maze[randWall[0]][randWall[1]-1] == 2) or
-                 (self.maze[randWall[0]][randWall[1]+1] == 2 and self.maze[randWall[0]][randWall[1]-1] == 0) or
-                 (self.maze[randWall[0]+1][randWall[1]] == 0 and self.maze[randWall[0]-1][randWall[1]] == 2) or
-                 (self.maze[randWall[0]+1][randWall[1]] == 2 and self.maze[randWall[0]-1][randWall[1]] == 0)) and
-                len(adjCells) == 1): # wall not on border, between undefined and cell, only 1 adjacent cell
-                self.maze[randWall[0]][randWall[1]] = 2 # wall becomes cell
-                # in the direction of the just-changed wall, make a wall
-                if randWall[0]-currRow == -1: # wall was row above
-                    try: 
-                        self.maze[currRow-2][currCol] = 1
-                    except IndexError:
-                        continue
-                elif randWall[0]-currRow == 1: # wall was row below
-                    try: 
-                        self.maze[currRow+2][currCol] = 1
-                    except IndexError:
-                        continue
-                elif randWall[1]-currCol == -1: # wall was left
-                    try:
-                        self.maze[currRow][currCol-2] = 1
-                    except IndexError:
+        # generation works on a flat bytearray (location r,c is at r*cols+c), which is quicker to poke one by one
+        grid = bytearray(rows*cols)
+        steps = (-cols,cols,-1,1) # up, down, left, right
+        frontier = [] # walls to pick from; picked walls are swapped with the last one and popped
+        queued = bytearray(rows*cols) # 1 if the location is in frontier, so it isn't added twice
+        randoms = [] # uniform [0,1) floats drawn from rng in bulk
+        def makeWalls(r, c):
+            '''Makes walls adjacent to cell, queueing every adjacent wall.'''
+            for dr,dc in ((-1,0),(1,0),(0,-1),(0,1)):
+                if 0 <= r+dr < rows and 0 <= c+dc < cols:
+                    i = (r+dr)*cols+c+dc
+                    if grid[i] != 2: # not cells
+                        grid[i] = 1
+                        if not queued[i]:
+                            queued[i] = 1
+                            frontier.append(i)
+        currRow = int(rng.integers(1,rows-1)) # start (not on edge)
+        currCol = int(rng.integers(1,cols-1))
+        grid[currRow*cols+currCol] = 2 # start
+        makeWalls(currRow,currCol)
+        while frontier:
+            if not randoms:
+                randoms = rng.random(4096).tolist()
+            k = int(randoms.pop()*len(frontier)) # select wall
+            wall = frontier[k]
+            frontier[k] = frontier[-1]
+            frontier.pop()
+            queued[wall] = 0
+            r,c = divmod(wall,cols)
+            if not (0 < r < rows-1 and 0 < c < cols-1): # wall on border
+                continue
+            up,down,left,right = (grid[wall+step] for step in steps)
+            if (((right == 0 and left == 2) or (right == 2 and left == 0) or
+                 (down == 0 and up == 2) or (down == 2 and up == 0)) and
+                (up == 2)+(down == 2)+(left == 2)+(right == 2) == 1): # between undefined and cell, only 1 adjacent cell
+                grid[wall] = 2 # wall becomes cell
+                # in the direction of the just-changed wall (relative to the current cell), make a wall
+                if r-currRow == -1: # wall was row above
+                    blocked = currRow-2,currCol
+                elif r-currRow == 1: # wall was row below
+                    blocked = currRow+2,currCol
+                elif c-currCol == -1: # wall was left
+                    blocked = currRow,currCol-2
+                elif c-currCol == 1: # wall was right
+                    blocked = currRow,currCol+2
+                else:
+                    blocked = None
+                if blocked is not None:
+                    if blocked[0] >= rows or blocked[1] >= cols: # past the far edge: leave the current cell as is
                         continue
-                elif randWall[1]-currCol == 1: # wall was right
-                    try:
-                        self.maze[currRow][currCol+2] = 1
-                    except IndexError:
-                        continue
-                currRow = randWall[0] # wall becomes current cell
-                currCol = randWall[1] 
-                self.makeWalls(currRow,currCol)
-                walls += self.findAdjVal(currRow,currCol,1)
-            walls.remove(randWall)
-        for i in range(self.rows): # poking start and end into border
-            if self.maze[i][1] == 2:
-                self.maze[i][0] = 2
-                break
-        for i in range(self.rows): # poking start and end into border
-            if self.maze[i][self.rows-2] == 2:
-                self.maze[i][self.rows-1] = 2
-                break
-        for r in range(self.rows): # replace leftover undefined with walls
-            for c in range(self.cols):
-                if self.maze[r][c] == 0:
-                    self.maze[r][c] = 1
+                    if blocked[0] >= 0 and blocked[1] >= 0: # before the near edge there is only border, which ends up wall anyway
+                        grid[blocked[0]*cols+blocked[1]] = 1
+                currRow = r # wall becomes current cell
+                currCol = c
+                makeWalls(currRow,currCol)
+        self.grid = np.frombuffer(grid,dtype=np.uint8).reshape(rows,cols)
+        starts = np.flatnonzero(self.grid[:,1] == 2) # poking start and end into border
+        if starts.size:
+            self.grid[starts[0],0] = 2
+        ends = np.flatnonzero(self.grid[:,self.cols-2] == 2)
+        if ends.size:
+            self.grid[ends[0],self.cols-1] = 2
+        self.grid[self.grid == 0] = 1 # replace leftover undefined with walls
 
-    def findAdjVal(self, r, c, value):
-        '''Helper method that returns list corresponding to 4 locations surrounding point:
-        tuple coordinate if the value is at the location, None otherwise.'''
-        # 0 is undefined, 1 is wall, 2 is cell
-        locs = []
-        for i in range(-1,2,2):
-            if self.inBounds(r+i,c) and self.maze[r+i][c] == value:
-                locs.append((r+i,c))
-        for i in range(-1,2,2):
-            if self.inBounds(r,c+i) and self.maze[r][c+i] == value:
-                locs.append((r,c+i))
-        return locs
-    
-    def makeWalls(self, r, c):
-        '''Helper method that makes walls adjacent to cell.'''
-        for i in range(-1,2,2): # starting walls
-            if self.inBounds(r+i,c) and self.maze[r+i][c] != 2: # not cells
-                self.maze[r+i][c] = 1
-        for i in range(-1,2,2):
-            if self.inBounds(r,c+i) and self.maze[r][c+i] != 2: # not cells
-                self.maze[r][c+i] = 1
+    @classmethod
+    def fromGrid(cls, grid):
+        '''Wraps an existing grid (e.g. from generate_many) in a Maze without generating anything.'''
+        maze = cls.__new__(cls)
+        maze.grid = np.asarray(grid,dtype=np.uint8)
+        maze.rows,maze.cols = maze.grid.shape
+        maze.rng = None
+        return maze
+
+    @property
+    def maze(self):
+        '''The grid itself; it can be indexed and iterated like the old list of lists (maze[r][c], for row in maze).'''
+        return self.grid
+
+    def tolist(self):
+        '''Returns the grid as a list of lists of ints.'''
+        return self.grid.tolist()
+
+    def tobytes(self):
+        '''Returns the grid as rows*cols bytes (one per location, row by row).'''
+        return self.grid.tobytes()
 
-    def inBounds(self, r, c):
-        '''Helper method determining whether coordinates are within maze bounds.'''
-        return 0 <= r < self.rows and 0 <= c < self.cols
-    
     def __str__(self):
-        string = ''
-        for r in range(self.rows):
-            for v in self.maze[r]:
-                string += str(v) + '  '
-            string += '\n'
-        return string
+        chars = np.full((self.rows,self.cols*3+1),ord(' '),dtype=np.uint8) # each value followed by 2 spaces, then a newline
+        chars[:,0:-1:3] = self.grid+ord('0')
+        chars[:,-1] = ord('\n')
+        return chars.tobytes().decode('ascii')
+
+def buildGrid(key, cols=8, rows=8):
+    '''Returns just the grid of Maze(cols, rows, key) (what generate_many's workers run).'''
+    return Maze(cols,rows,key).grid
+
+def generate_many(keys, cols=8, rows=8, workers=None):
+    '''Generates one maze per key in a process pool of workers processes (default one per CPU) and returns
+    their grids (rows x cols uint8 arrays) in the order of keys. workers = 1 generates them in this process.'''
+    keys = list(keys)
+    if workers == 1 or len(keys) < 2:
+        return [buildGrid(key,cols,rows) for key in keys]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(buildGrid,keys,[cols]*len(keys),[rows]*len(keys)))
+
+def benchmark(largest=4096, file=sys.stdout):
+    '''Times Maze generation for square sizes from 8x8 up to largest x largest (doubling each time)
+    and prints one line per size. Returns a list of (size, seconds) pairs.'''
+    results = []
+    size = 8
+    while size <= largest:
+        start = time.perf_counter()
+        m = Maze(size,size,key=size)
+        seconds = time.perf_counter()-start
+        results.append((size,seconds))
+        print('%5dx%-5d %9.3f s %11.0f cells/s %9.2f MB' % (size,size,seconds,size*size/seconds,m.grid.nbytes/2**20),file=file)
+        size *= 2
+    return results
 
 if __name__ == '__main__':
-    print(Maze())
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench': # python mazegen.py bench [largest size]
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 4096)
+    else:
+        print(Maze())
\ No newline at end of file